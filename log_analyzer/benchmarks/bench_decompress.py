@@ -0,0 +1,95 @@
+import argparse
+import bz2
+import gzip
+import lzma
+import shutil
+import tempfile
+import time
+
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any
+
+import structlog
+
+from log_analyzer.log_analyzer.aggregate import aggregate_lines
+from log_analyzer.log_analyzer.decompress import (
+    iter_lines,
+    iter_lines_mmap,
+    iter_lines_threaded,
+    open_log,
+)
+from log_analyzer.log_analyzer.log_analyzer import parse_line_bytes
+
+from .synthetic import generate_log
+
+AVERAGE_LINE_SIZE = 190
+
+COMPRESSORS: dict[str, Callable[[str], Any]] = {
+    ".gz": lambda path: gzip.open(path, "wb"),
+    ".bz2": lambda path: bz2.open(path, "wb"),
+    ".xz": lambda path: lzma.open(path, "wb", preset=1),
+}
+
+
+def old_read_lines(path: str) -> Iterable[str]:
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        yield from file
+
+
+def buffered_lines(path: str) -> Iterable[bytes]:
+    with open_log(path) as file:
+        yield from file
+
+
+def timed(name: str, lines: Iterable[Any]) -> None:
+    started = time.perf_counter()
+    count = sum(1 for _ in lines)
+    elapsed = time.perf_counter() - started
+    print(f"{name:>40}: {elapsed:.2f}s, {count / elapsed:,.0f} lines/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сравнение путей чтения сжатых логов")
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--formats", nargs="+", default=sorted(COMPRESSORS))
+    args = parser.parse_args()
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(50))
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = generate_log(
+            Path(tmp) / "nginx-access-ui.log-20170630",
+            args.size_mb * 1024 * 1024 // AVERAGE_LINE_SIZE,
+        )
+        print("--- plain")
+        timed("open_log readline", buffered_lines(str(plain)))
+        timed("iter_lines_mmap", iter_lines_mmap(str(plain)))
+        for name, source in (
+            ("open_log", buffered_lines(str(plain))),
+            ("mmap", iter_lines_mmap(str(plain))),
+        ):
+            started = time.perf_counter()
+            aggregate_lines(source, parse_line_bytes).report(1000)
+            elapsed = time.perf_counter() - started
+            print(f"{f'read+parse {name}':>40}: {elapsed:.2f}s")
+
+        for suffix in args.formats:
+            path = str(plain) + suffix
+            with open(plain, "rb") as src, COMPRESSORS[suffix](path) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            print(f"--- {suffix}")
+            if suffix == ".gz":
+                timed("gzip.open(rt) (old read_lines)", old_read_lines(path))
+            timed("iter_lines(threaded=False)", iter_lines(path, threaded=False))
+            timed("iter_lines_threaded", iter_lines_threaded(path))
+
+            for threaded in (False, True):
+                started = time.perf_counter()
+                aggregate_lines(iter_lines(path, threaded=threaded), parse_line_bytes).report(1000)
+                elapsed = time.perf_counter() - started
+                print(f"{f'read+parse threaded={threaded}':>40}: {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import random
+import time
+
+from collections.abc import Callable
+from typing import Any
+
+import structlog
+
+from log_analyzer.log_analyzer.aggregate import aggregate_lines
+from log_analyzer.log_analyzer.log_analyzer import parse_line, parse_line_bytes, report_maker
+from log_analyzer.log_analyzer.numpy_engine import numpy_aggregate_lines
+
+from .synthetic import make_line
+
+
+def timed(name: str, case: Callable[[], Any], lines: int) -> Any:
+    started = time.perf_counter()
+    result = case()
+    elapsed = time.perf_counter() - started
+    print(f"{name:>28}: {elapsed:.3f}s, {lines / elapsed:,.0f} lines/s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Движки агрегации: python против numpy")
+    parser.add_argument("--lines", type=int, default=500_000)
+    parser.add_argument("--urls", type=int, default=10_000)
+    parser.add_argument("--report-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(50))
+    rnd = random.Random(42)
+    lines = [make_line(rnd, args.urls) for _ in range(args.lines)]
+    raw_lines = [line.encode("utf-8") for line in lines]
+    size = args.report_size
+
+    reference = timed(
+        "report_maker (str, exact)",
+        lambda: report_maker(lines, parse_line, size, median_error=0),
+        args.lines,
+    )
+    timed(
+        "python engine (sketch)",
+        lambda: aggregate_lines(raw_lines, parse_line_bytes).report(size),
+        args.lines,
+    )
+    exact = timed(
+        "python engine (exact)",
+        lambda: aggregate_lines(raw_lines, parse_line_bytes, 0).report(size),
+        args.lines,
+    )
+    vectorised = timed(
+        "numpy engine",
+        lambda: numpy_aggregate_lines(raw_lines, parse_line_bytes).report(size),
+        args.lines,
+    )
+    print("numpy report identical to exact python engine:", vectorised == exact == reference)
+
+
+if __name__ == "__main__":
+    main()
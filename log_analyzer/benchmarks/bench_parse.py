@@ -0,0 +1,37 @@
+import argparse
+import random
+import timeit
+
+import structlog
+
+from log_analyzer.log_analyzer.aggregate import aggregate_lines
+from log_analyzer.log_analyzer.log_analyzer import parse_line, parse_line_bytes, report_maker
+
+from .synthetic import make_line
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="parse_line против parse_line_bytes")
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--urls", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(50))
+    rnd = random.Random(42)
+    lines = [make_line(rnd, args.urls) for _ in range(args.lines)]
+    raw_lines = [line.encode("utf-8") for line in lines]
+
+    cases = {
+        "parse_line": lambda: [parse_line(line) for line in lines],
+        "parse_line_bytes": lambda: [parse_line_bytes(line) for line in raw_lines],
+        "report_maker": lambda: report_maker(lines, parse_line, 1000),
+        "aggregate_lines(bytes)": lambda: aggregate_lines(raw_lines, parse_line_bytes).report(1000),
+    }
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print(f"{name:>24}: {best:.3f}s, {args.lines / best:,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
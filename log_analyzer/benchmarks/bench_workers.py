@@ -0,0 +1,46 @@
+import argparse
+import os
+import tempfile
+import time
+
+from pathlib import Path
+
+from log_analyzer.log_analyzer.log_analyzer import (
+    parse_line,
+    parse_line_bytes,
+    read_lines,
+    report_maker,
+)
+from log_analyzer.log_analyzer.parallel import parallel_aggregate
+
+from .synthetic import generate_log
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Масштабирование --workers")
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--urls", type=int, default=10_000)
+    parser.add_argument("--gz", action="store_true")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        suffix = ".gz" if args.gz else ""
+        path = generate_log(
+            Path(tmp) / f"nginx-access-ui.log-20170630{suffix}", args.lines, args.urls
+        )
+
+        started = time.perf_counter()
+        report_maker(read_lines(str(path)), parse_line, 1000)
+        baseline = time.perf_counter() - started
+        print(f"report_maker: {baseline:.2f}s")
+
+        for workers in range(1, args.max_workers + 1):
+            started = time.perf_counter()
+            parallel_aggregate(str(path), parse_line_bytes, workers).report(1000)
+            elapsed = time.perf_counter() - started
+            print(f"workers={workers}: {elapsed:.2f}s, speedup x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
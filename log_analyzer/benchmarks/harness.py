@@ -0,0 +1,174 @@
+import argparse
+import cProfile
+import datetime
+import itertools
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import structlog
+
+from log_analyzer.log_analyzer.log_analyzer import (
+    parse_line,
+    read_lines,
+    report_maker,
+    write_report,
+)
+
+from .synthetic import generate_log
+
+TEMPLATE = str(Path(__file__).resolve().parent.parent / "templates" / "report.html")
+STAGES = ("read_lines", "parse_line", "report_maker", "write_report")
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def prepare_stage(name: str, path: str, tmp: str) -> Callable[[], Any]:
+    """Готовит входные данные стадии (без замера) и возвращает сам замеряемый шаг."""
+    if name == "read_lines":
+        return lambda: list(read_lines(path))
+    if name == "write_report":
+        report = report_maker(list(read_lines(path)), parse_line, 1000)
+        return lambda: write_report(str(Path(tmp) / "reports" / "report.html"), TEMPLATE, report)
+    source = list(read_lines(path))
+    if name == "parse_line":
+        return lambda: [parse_line(line) for line in source]
+    return lambda: report_maker(source, parse_line, 1000)
+
+
+def run_stage(
+    name: str, lines: int, path: str, tmp: str, profile: str, profile_dir: str, scenario: str
+) -> dict[str, float]:
+    """Одна стадия в своём процессе: peak RSS не наследует пики прошлых стадий.
+
+    rss_before_mb — пик после подготовки входных данных, peak_rss_mb — пик с учётом самой стадии.
+    """
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(50))
+    case = prepare_stage(name, path, tmp)
+    rss_before = peak_rss_mb()
+    profiler: Any = None
+    if profile == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+
+    started = time.perf_counter()
+    case()
+    elapsed = time.perf_counter() - started
+
+    if profile == "cprofile":
+        profiler.disable()
+        profiler.dump_stats(str(Path(profile_dir) / f"{scenario}-{name}.prof"))
+    elif profile == "pyinstrument":
+        profiler.stop()
+        (Path(profile_dir) / f"{scenario}-{name}.html").write_text(profiler.output_html())
+
+    return {
+        "seconds": round(elapsed, 4),
+        "lines_per_second": round(lines / elapsed) if elapsed else 0,
+        "rss_before_mb": round(rss_before, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_scenario(lines: int, urls: int, fmt: str, profile: str, profile_dir: str) -> dict[str, Any]:
+    scenario = f"{fmt}-{lines}-{urls}"
+    stages: dict[str, dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        suffix = ".gz" if fmt == "gz" else ""
+        path = str(generate_log(Path(tmp) / f"nginx-access-ui.log-20170630{suffix}", lines, urls))
+        for name in STAGES:
+            # Каждая стадия в свежем процессе, чтобы peak RSS не копился между стадиями.
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                stages[name] = pool.submit(
+                    run_stage, name, lines, path, tmp, profile, profile_dir, scenario
+                ).result()
+
+    return {"lines": lines, "urls": urls, "format": fmt, "stages": stages}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: dict[str, Any], current: dict[str, Any]) -> None:
+    def key(result: dict[str, Any]) -> tuple[int, int, str]:
+        return result["lines"], result["urls"], result["format"]
+
+    old = {key(result): result for result in previous["results"]}
+    for result in current["results"]:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        for stage, numbers in result["stages"].items():
+            if stage not in before["stages"]:
+                continue
+            ratio = numbers["seconds"] / max(before["stages"][stage]["seconds"], 1e-9)
+            print(f"{'/'.join(map(str, key(result)))} {stage}: x{ratio:.2f} time vs previous")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк пайплайна log_analyzer")
+    parser.add_argument("--lines", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--urls", type=int, nargs="+", default=[100, 10_000])
+    parser.add_argument("--formats", nargs="+", choices=["plain", "gz"], default=["plain", "gz"])
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="JSON с результатами прошлого прогона")
+    parser.add_argument("--profile", choices=["none", "cprofile", "pyinstrument"], default="none")
+    parser.add_argument("--profile-dir", default="profiles")
+    args = parser.parse_args()
+
+    if args.profile != "none":
+        Path(args.profile_dir).mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for lines, urls, fmt in itertools.product(args.lines, args.urls, args.formats):
+        result = run_scenario(lines, urls, fmt, args.profile, args.profile_dir)
+        results.append(result)
+        summary = ", ".join(
+            f"{stage} {numbers['lines_per_second']:,} lines/s"
+            for stage, numbers in result["stages"].items()
+        )
+        print(f"{fmt} lines={lines} urls={urls}: {summary}")
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(output, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(json.load(file), output)
+
+
+if __name__ == "__main__":
+    main()
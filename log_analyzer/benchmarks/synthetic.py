@@ -0,0 +1,27 @@
+import gzip
+import random
+
+from pathlib import Path
+
+LINE_TEMPLATE = (
+    '{ip} -  - [29/Jun/2017:03:50:22 +0300] "GET {url} HTTP/1.1" 200 927 "-" '
+    '"Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5" "-" '
+    '"1498697422-2190034393-4708-9752759" "dc7161be3" {request_time:.3f}\n'
+)
+
+
+def make_line(rnd: random.Random, urls: int) -> str:
+    return LINE_TEMPLATE.format(
+        ip=f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(256)}",
+        url=f"/api/v2/banner/{int(rnd.paretovariate(1.2)) % urls}",
+        request_time=rnd.lognormvariate(-1.5, 1),
+    )
+
+
+def generate_log(path: Path, lines: int, urls: int = 10_000, seed: int = 42) -> Path:
+    rnd = random.Random(seed)
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "wt", encoding="utf-8") as file:
+        for _ in range(lines):
+            file.write(make_line(rnd, urls))
+    return path
@@ -1,18 +1,71 @@
+from .aggregate import (
+    DEFAULT_MEDIAN_ERROR,
+    OTHER_URL,
+    PERCENTILES,
+    ExactSamples,
+    LogAggregate,
+    QuantileSketch,
+    UrlStats,
+    aggregate_lines,
+    linear_quantile,
+)
+from .columnar import ColumnarReport, StrColumn, export_columns, load_columns
+from .decompress import (
+    OPENERS,
+    is_compressed,
+    iter_blocks_threaded,
+    iter_lines,
+    iter_lines_mmap,
+    iter_lines_threaded,
+    open_log,
+    sample_lines,
+)
+from .errors import (
+    ErrorRateExceeded,
+    ErrorRateParser,
+    ParseErrors,
+    collect_parse_errors,
+    prescan,
+)
 from .log_analyzer import (
     FILE_NAME_PATTERN,
     LOG_PATTERN,
+    LOG_PATTERN_BYTES,
     REQUEST_PATTERN,
     config,
     config_parser,
     configure_structlog,
     find_latest_log,
+    find_logs_in_range,
     handle_exception,
     main,
+    make_parser,
+    parse_errors,
     parse_line,
+    parse_line_bytes,
     read_lines,
+    read_lines_bytes,
     report_maker,
+    stop_log_listener,
     write_report,
 )
+from .multiday import cache_file_for, cached_aggregate_file, load_cached, range_aggregate
+from .normalize import NormalizingParser, UrlNormalizer, parser_fingerprint
+from .numpy_engine import NumpyAggregate, numpy_aggregate_lines
+from .parallel import (
+    aggregate_chunk,
+    aggregate_file,
+    aggregate_range,
+    parallel_aggregate,
+    split_ranges,
+)
+from .state import (
+    Checkpoint,
+    SourceIdentity,
+    incremental_aggregate,
+    load_checkpoint,
+    save_checkpoint,
+)
 
 __all__ = [
     "configure_structlog",
@@ -28,4 +81,56 @@ __all__ = [
     "FILE_NAME_PATTERN",
     "LOG_PATTERN",
     "REQUEST_PATTERN",
+    "LogAggregate",
+    "UrlStats",
+    "QuantileSketch",
+    "ExactSamples",
+    "DEFAULT_MEDIAN_ERROR",
+    "parallel_aggregate",
+    "aggregate_range",
+    "aggregate_chunk",
+    "split_ranges",
+    "aggregate_lines",
+    "parse_line_bytes",
+    "read_lines_bytes",
+    "LOG_PATTERN_BYTES",
+    "incremental_aggregate",
+    "Checkpoint",
+    "SourceIdentity",
+    "load_checkpoint",
+    "save_checkpoint",
+    "find_logs_in_range",
+    "range_aggregate",
+    "cached_aggregate_file",
+    "cache_file_for",
+    "load_cached",
+    "aggregate_file",
+    "open_log",
+    "OPENERS",
+    "is_compressed",
+    "iter_lines",
+    "iter_lines_threaded",
+    "iter_blocks_threaded",
+    "UrlNormalizer",
+    "NormalizingParser",
+    "make_parser",
+    "OTHER_URL",
+    "export_columns",
+    "load_columns",
+    "ColumnarReport",
+    "StrColumn",
+    "NumpyAggregate",
+    "numpy_aggregate_lines",
+    "ParseErrors",
+    "parse_errors",
+    "stop_log_listener",
+    "ErrorRateExceeded",
+    "ErrorRateParser",
+    "prescan",
+    "sample_lines",
+    "iter_lines_mmap",
+    "PERCENTILES",
+    "linear_quantile",
+    "parser_fingerprint",
+    "collect_parse_errors",
 ]
@@ -0,0 +1,282 @@
+import heapq
+import math
+
+from collections.abc import Callable, Iterable, Sequence
+from statistics import median
+from typing import Any, Protocol
+
+DEFAULT_MEDIAN_ERROR = 0.001
+PERCENTILES = (90, 95, 99)
+
+OTHER_URL = b"<other>"
+
+Url = str | bytes
+Parser = Callable[[bytes], tuple[bytes, float] | None]
+
+
+class TimeDistribution(Protocol):
+    def add(self, value: float) -> None: ...
+
+    def median(self) -> float: ...
+
+    def quantile(self, q: float) -> float: ...
+
+    def merge(self, other: "TimeDistribution") -> None: ...
+
+    def to_dict(self) -> dict[str, Any]: ...
+
+
+def linear_quantile(values: Sequence[float], q: float) -> float:
+    position = q * (len(values) - 1)
+    lower = int(position)
+    if lower + 1 >= len(values):
+        return values[lower]
+    return values[lower] + (values[lower + 1] - values[lower]) * (position - lower)
+
+
+class ExactSamples:
+    """Точный режим: хранит все значения, подходит для небольших файлов."""
+
+    __slots__ = ("values",)
+
+    def __init__(self) -> None:
+        self.values: list[float] = []
+
+    def add(self, value: float) -> None:
+        self.values.append(value)
+
+    def median(self) -> float:
+        return median(self.values)
+
+    def quantile(self, q: float) -> float:
+        self.values.sort()
+        return linear_quantile(self.values, q)
+
+    def merge(self, other: TimeDistribution) -> None:
+        if not isinstance(other, ExactSamples):
+            raise TypeError("Нельзя смешивать точный режим и скетч")
+        self.values.extend(other.values)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"values": self.values}
+
+
+class QuantileSketch:
+    """Лог-гистограмма: относительная ошибка квантилей не больше relative_error."""
+
+    __slots__ = ("relative_error", "_log_gamma", "buckets", "zero_count", "count")
+
+    def __init__(self, relative_error: float = DEFAULT_MEDIAN_ERROR) -> None:
+        if not 0 < relative_error < 1:
+            raise ValueError("relative_error должен быть в интервале (0, 1)")
+        self.relative_error = relative_error
+        self._log_gamma = math.log((1 + relative_error) / (1 - relative_error))
+        self.buckets: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def _bucket_value(self, index: int) -> float:
+        gamma = math.exp(self._log_gamma)
+        return 2 * gamma**index / (gamma + 1)
+
+    def _rank_value(self, rank: int) -> float:
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return self._bucket_value(index)
+        return self._bucket_value(max(self.buckets))
+
+    def quantile(self, q: float) -> float:
+        # Интерполяция между соседними рангами, как в linear_quantile: значения
+        # обоих рангов в пределах relative_error, значит и их выпуклая комбинация.
+        if not self.count:
+            raise ValueError("quantile of empty sketch")
+        position = q * (self.count - 1)
+        lower = int(position)
+        value = self._rank_value(lower)
+        if position == lower:
+            return value
+        return value + (self._rank_value(lower + 1) - value) * (position - lower)
+
+    def median(self) -> float:
+        return self.quantile(0.5)
+
+    def merge(self, other: TimeDistribution) -> None:
+        if not isinstance(other, QuantileSketch) or other.relative_error != self.relative_error:
+            raise TypeError("Можно объединять только скетчи с одинаковой ошибкой")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "zero_count": self.zero_count,
+            "buckets": [[index, count] for index, count in self.buckets.items()],
+        }
+
+
+def make_distribution(median_error: float) -> TimeDistribution:
+    if median_error <= 0:
+        return ExactSamples()
+    return QuantileSketch(median_error)
+
+
+def distribution_from_dict(data: dict[str, Any], median_error: float) -> TimeDistribution:
+    if median_error <= 0:
+        samples = ExactSamples()
+        samples.values = list(data["values"])
+        return samples
+    sketch = QuantileSketch(median_error)
+    sketch.zero_count = data["zero_count"]
+    sketch.buckets = {index: count for index, count in data["buckets"]}
+    sketch.count = sketch.zero_count + sum(sketch.buckets.values())
+    return sketch
+
+
+class UrlStats:
+    __slots__ = ("count", "time_sum", "time_max", "times")
+
+    def __init__(self, times: TimeDistribution) -> None:
+        self.count = 0
+        self.time_sum = 0.0
+        self.time_max = 0.0
+        self.times = times
+
+    def add(self, request_time: float) -> None:
+        self.count += 1
+        self.time_sum += request_time
+        if request_time > self.time_max:
+            self.time_max = request_time
+        self.times.add(request_time)
+
+    def merge(self, other: "UrlStats") -> None:
+        self.count += other.count
+        self.time_sum += other.time_sum
+        if other.time_max > self.time_max:
+            self.time_max = other.time_max
+        self.times.merge(other.times)
+
+    def to_list(self) -> list[Any]:
+        return [self.count, self.time_sum, self.time_max, self.times.to_dict()]
+
+    @classmethod
+    def from_list(cls, data: list[Any], median_error: float) -> "UrlStats":
+        stats = cls(distribution_from_dict(data[3], median_error))
+        stats.count, stats.time_sum, stats.time_max = data[0], data[1], data[2]
+        return stats
+
+
+class LogAggregate:
+    def __init__(self, median_error: float = DEFAULT_MEDIAN_ERROR) -> None:
+        self.median_error = median_error
+        self.urls: dict[Url, UrlStats] = {}
+
+    def add(self, url: Url, request_time: float) -> None:
+        stats = self.urls.get(url)
+        if stats is None:
+            stats = self.urls[url] = UrlStats(make_distribution(self.median_error))
+        stats.add(request_time)
+
+    def merge(self, other: "LogAggregate") -> None:
+        for url, other_stats in other.urls.items():
+            stats = self.urls.get(url)
+            if stats is None:
+                self.urls[url] = other_stats
+            else:
+                stats.merge(other_stats)
+
+    def limit(self, max_urls: int) -> None:
+        if not max_urls or len(self.urls) <= max_urls:
+            return
+        bytes_urls = all(isinstance(url, bytes) for url in self.urls)
+        other_url: Url = OTHER_URL if bytes_urls else OTHER_URL.decode()
+        other = self.urls.pop(other_url, None)
+
+        keep = heapq.nlargest(max_urls, self.urls, key=lambda url: self.urls[url].time_sum)
+        kept = {url: self.urls.pop(url) for url in keep}
+        for stats in self.urls.values():
+            if other is None:
+                other = stats
+            else:
+                other.merge(stats)
+
+        self.urls = kept
+        if other is not None:
+            self.urls[other_url] = other
+
+    def to_dict(self) -> dict[str, Any]:
+        bytes_urls = all(isinstance(url, bytes) for url in self.urls)
+        return {
+            "median_error": self.median_error,
+            "bytes_urls": bytes_urls,
+            "urls": [
+                [url.decode("latin-1") if isinstance(url, bytes) else url, *stats.to_list()]
+                for url, stats in self.urls.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "LogAggregate":
+        aggregate = cls(data["median_error"])
+        for url, *stats in data["urls"]:
+            key: Url = url.encode("latin-1") if data["bytes_urls"] else url
+            aggregate.urls[key] = UrlStats.from_list(stats, aggregate.median_error)
+        return aggregate
+
+    def report(self, report_size: int) -> list[dict[str, int | float | str]]:
+        result: list[dict[str, int | float | str]] = []
+
+        count_all: int = 0
+        time_all: int | float = 0
+
+        for stats in self.urls.values():
+            count_all += stats.count
+            time_all += stats.time_sum
+
+        top = heapq.nlargest(
+            report_size, self.urls.items(), key=lambda item: round(item[1].time_sum, 3)
+        )
+        for url, stats in top:
+            time_sum = round(stats.time_sum, 3)
+            row: dict[str, int | float | str] = {
+                "url": url.decode("utf-8", errors="replace") if isinstance(url, bytes) else url,
+                "count": stats.count,
+                "time_sum": time_sum,
+                "time_avg": round(stats.time_sum / stats.count, 3),
+                "time_max": stats.time_max,
+                "time_med": round(stats.times.median(), 3),
+            }
+            for percentile in PERCENTILES:
+                row[f"time_p{percentile}"] = round(stats.times.quantile(percentile / 100), 3)
+            if count_all > 0:
+                row["count_perc"] = round(((stats.count * 100) / count_all), 3)
+            if time_all > 0:
+                row["time_perc"] = round(((time_sum * 100) / time_all), 3)
+            result.append(row)
+
+        return result
+
+
+def aggregate_lines(
+    source: Iterable[bytes], parser: Parser, median_error: float = DEFAULT_MEDIAN_ERROR
+) -> LogAggregate:
+    aggregate = LogAggregate(median_error)
+
+    for line in source:
+        parsed_line = parser(line)
+        if parsed_line:
+            aggregate.add(*parsed_line)
+
+    return aggregate
@@ -0,0 +1,165 @@
+import json
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+from collections.abc import Iterator, Sequence
+from types import TracebackType
+from typing import Any, overload
+
+MAGIC = b"LACOL1\0\0"
+ALIGN = 8
+
+
+def _column_type(values: list[Any]) -> str:
+    if any(isinstance(value, str) for value in values):
+        return "utf8"
+    if any(isinstance(value, float) for value in values):
+        return "float64"
+    return "int64"
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % ALIGN)
+
+
+def _encode_column(values: list[Any], dtype: str) -> list[bytes]:
+    if dtype == "utf8":
+        encoded = [str(value if value is not None else "").encode("utf-8") for value in values]
+        offsets = array("q", [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        return [offsets.tobytes(), b"".join(encoded)]
+    if dtype == "float64":
+        return [array("d", [float("nan") if v is None else v for v in values]).tobytes()]
+    return [array("q", [0 if v is None else v for v in values]).tobytes()]
+
+
+def export_columns(path: str, report: list[dict[str, int | float | str]]) -> None:
+    names: list[str] = []
+    for row in report:
+        names.extend(name for name in row if name not in names)
+
+    blocks: list[bytes] = []
+    columns: list[dict[str, Any]] = []
+    position = 0
+    for name in names:
+        values = [row.get(name) for row in report]
+        dtype = _column_type(values)
+        column: dict[str, Any] = {"name": name, "dtype": dtype, "buffers": []}
+        for block in _encode_column(values, dtype):
+            column["buffers"].append([position, len(block)])
+            blocks.extend([block, _padding(len(block))])
+            position += len(block) + len(_padding(len(block)))
+        columns.append(column)
+
+    header = json.dumps(
+        {"rows": len(report), "byteorder": sys.byteorder, "columns": columns}
+    ).encode("utf-8")
+    header += b" " * (-len(header) % ALIGN)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<Q", len(header)))
+        file.write(header)
+        for block in blocks:
+            file.write(block)
+    os.replace(tmp_path, path)
+
+
+class StrColumn(Sequence[str]):
+    def __init__(self, offsets: memoryview, data: memoryview) -> None:
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return str(self.data[self.offsets[index] : self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+
+class ColumnarReport:
+    """Колонки отчёта поверх mmap: числовые колонки — memoryview без копирования."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a columnar report")
+
+        (header_size,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        data_start = len(MAGIC) + 8 + header_size
+        header = json.loads(self._mmap[len(MAGIC) + 8 : data_start])
+        if header["byteorder"] != sys.byteorder:
+            self._mmap.close()
+            raise ValueError("columnar report was written on a different byte order")
+
+        self.rows: int = header["rows"]
+        self._buffer = memoryview(self._mmap)
+        self.columns: dict[str, memoryview[int] | memoryview[float] | StrColumn] = {}
+        for column in header["columns"]:
+            views = [
+                self._buffer[data_start + offset : data_start + offset + size]
+                for offset, size in column["buffers"]
+            ]
+            if column["dtype"] == "utf8":
+                self.columns[column["name"]] = StrColumn(views[0].cast("q"), views[1])
+            elif column["dtype"] == "float64":
+                self.columns[column["name"]] = views[0].cast("d")
+            else:
+                self.columns[column["name"]] = views[0].cast("q")
+
+    def __getitem__(self, name: str) -> "memoryview[int] | memoryview[float] | StrColumn":
+        return self.columns[name]
+
+    def to_rows(self) -> list[dict[str, int | float | str]]:
+        return [
+            {name: values[i] for name, values in self.columns.items()} for i in range(self.rows)
+        ]
+
+    def close(self) -> None:
+        for values in self.columns.values():
+            if isinstance(values, StrColumn):
+                values.offsets.release()
+                values.data.release()
+            else:
+                values.release()
+        self.columns = {}
+        self._buffer.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "ColumnarReport":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+def load_columns(path: str) -> ColumnarReport:
+    return ColumnarReport(path)
@@ -0,0 +1,170 @@
+import bz2
+import gzip
+import io
+import itertools
+import lzma
+import mmap
+import os
+import queue
+import threading
+
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+READ_BUFFER_SIZE = 1024 * 1024
+QUEUE_SIZE = 8
+
+
+def _open_zstd(path: str) -> Any:
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("Для чтения .zst логов нужен пакет zstandard") from e
+    return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+
+
+OPENERS: dict[str, Callable[[str], Any]] = {
+    ".gz": lambda path: gzip.open(path, "rb"),
+    ".bz2": lambda path: bz2.open(path, "rb"),
+    ".xz": lambda path: lzma.open(path, "rb"),
+    ".lzma": lambda path: lzma.open(path, "rb"),
+    ".zst": _open_zstd,
+}
+
+
+def is_compressed(path: str) -> bool:
+    return Path(path).suffix in OPENERS
+
+
+def open_log(path: str, buffer_size: int = READ_BUFFER_SIZE) -> io.BufferedReader:
+    opener = OPENERS.get(Path(path).suffix)
+    raw = io.FileIO(path, "rb") if opener is None else opener(path)
+    return io.BufferedReader(raw, buffer_size)
+
+
+def iter_blocks_threaded(
+    path: str, block_size: int = READ_BUFFER_SIZE, queue_size: int = QUEUE_SIZE
+) -> Iterator[bytes]:
+    blocks: queue.Queue[bytes | BaseException | None] = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item: bytes | BaseException | None) -> bool:
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            with open_log(path, block_size) as file:
+                while block := file.read(block_size):
+                    if not put(block):
+                        return
+        except BaseException as e:
+            put(e)
+            return
+        put(None)
+
+    thread = threading.Thread(target=produce, name="log-decompressor", daemon=True)
+    thread.start()
+    try:
+        while (item := blocks.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_lines_threaded(path: str, block_size: int = READ_BUFFER_SIZE) -> Iterator[bytes]:
+    tail = b""
+    for block in iter_blocks_threaded(path, block_size):
+        end = block.rfind(b"\n") + 1
+        if not end:
+            tail += block
+            continue
+        yield from io.BytesIO(tail + block[:end])
+        tail = block[end:]
+    if tail:
+        yield tail
+
+
+def _iter_file_range(file: io.BufferedReader, start: int, end: int) -> Iterator[bytes]:
+    file.seek(start)
+    position = start
+    while position < end:
+        line = file.readline()
+        if not line:
+            return
+        position += len(line)
+        yield line
+
+
+def iter_lines_mmap(
+    path: str, start: int = 0, end: int | None = None, block_size: int = READ_BUFFER_SIZE
+) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            yield from _iter_file_range(file, start, end)
+            return
+
+    with mapped, memoryview(mapped) as view:
+        if hasattr(mapped, "madvise"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        if end < size and mapped[end - 1] != ord("\n"):
+            end = mapped.find(b"\n", end) + 1 or size
+
+        position = start
+        while position < end:
+            stop = min(position + block_size, end)
+            if stop < end:
+                newline = mapped.rfind(b"\n", position, stop)
+                stop = newline + 1 if newline >= 0 else mapped.find(b"\n", stop, end) + 1 or end
+            yield from io.BytesIO(view[position:stop])
+            position = stop
+
+
+def iter_lines(path: str, threaded: bool = True) -> Iterator[bytes]:
+    if not is_compressed(path):
+        yield from iter_lines_mmap(path)
+        return
+    if threaded:
+        yield from iter_lines_threaded(path)
+        return
+    with open_log(path) as file:
+        yield from file
+
+
+def sample_lines(path: str, count: int) -> list[bytes]:
+    if is_compressed(path):
+        with open_log(path) as file:
+            return list(itertools.islice(file, count))
+
+    size = os.path.getsize(path)
+    lines: list[bytes] = []
+    line_end = 0
+    with open(path, "rb") as file:
+        for i in range(count):
+            offset = size * i // count
+            if offset <= line_end:
+                file.seek(line_end)
+            else:
+                file.seek(offset)
+                file.readline()
+            line = file.readline()
+            if not line:
+                break
+            lines.append(line)
+            line_end = file.tell()
+    return lines
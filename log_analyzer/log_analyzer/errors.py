@@ -0,0 +1,154 @@
+import time
+
+from collections import Counter
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any, TypeVar
+
+import structlog
+
+from .aggregate import Parser
+from .decompress import sample_lines
+
+ERROR_SAMPLES = 10
+ERROR_LOG_INTERVAL = 10.0
+ERROR_THRESHOLD = 0.2
+ERROR_MIN_LINES = 1000
+
+log = structlog.get_logger()
+
+T = TypeVar("T")
+Samples = list[tuple[str, str]]
+
+
+class ParseErrors:
+    """Ошибки разбора: счётчики по причинам, первые N строк в лог целиком, дальше только сводка."""
+
+    def __init__(
+        self,
+        samples: int = ERROR_SAMPLES,
+        interval: float = ERROR_LOG_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.samples = samples
+        self.interval = interval
+        self.clock = clock
+        self.counts: Counter[str] = Counter()
+        # В процессе-воркере образцы копятся здесь и пишутся в лог родителем (см. merge).
+        self.deferred: Samples | None = None
+        self._logged = 0
+        self._last_report = clock()
+
+    def record(self, reason: str, sample: str | bytes) -> None:
+        self.counts[reason] += 1
+        if self._logged < self.samples:
+            self._logged += 1
+            if isinstance(sample, bytes):
+                sample = sample.decode("utf-8", errors="replace")
+            if self.deferred is not None:
+                self.deferred.append((reason, sample))
+            else:
+                log.error("Oh shit! I'm sorry! There is no such line", reason=reason, line=sample)
+            return
+        if self.deferred is None:
+            self._report_periodically()
+
+    def _report_periodically(self) -> None:
+        now = self.clock()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            log.error("Oh shit! I'm sorry! Lines keep failing to parse", errors=dict(self.counts))
+
+    def merge(self, counts: Counter[str], samples: Samples) -> None:
+        """Добавляет счётчики и образцы строк из процесса-воркера."""
+        self.counts.update(counts)
+        for reason, sample in samples:
+            if self._logged >= self.samples:
+                break
+            self._logged += 1
+            log.error("Oh shit! I'm sorry! There is no such line", reason=reason, line=sample)
+        if counts:
+            self._report_periodically()
+
+    def summary(self) -> None:
+        if self.counts:
+            log.error(
+                "Oh shit! I'm sorry! Some lines were not parsed",
+                total=self.counts.total(),
+                errors=dict(self.counts),
+            )
+
+    @contextmanager
+    def muted(self) -> Iterator[None]:
+        """Ошибки внутри блока не пишутся в лог и не остаются в счётчиках."""
+        counts, logged, deferred = self.counts.copy(), self._logged, self.deferred
+        self.deferred = []
+        try:
+            yield
+        finally:
+            self.counts, self._logged, self.deferred = counts, logged, deferred
+
+    def reset(self) -> None:
+        self.counts.clear()
+        self._logged = 0
+        self._last_report = self.clock()
+
+
+parse_errors = ParseErrors()
+
+
+def collect_parse_errors(func: Callable[..., T], *args: Any) -> tuple[T, Counter[str], Samples]:
+    """Выполняет задачу в процессе-воркере и возвращает её результат вместе с ошибками разбора.
+
+    Счётчики воркера обнуляются перед каждой задачей: процессы пула переиспользуются.
+    """
+    parse_errors.reset()
+    parse_errors.deferred = []
+    try:
+        result = func(*args)
+        return result, parse_errors.counts.copy(), parse_errors.deferred
+    finally:
+        parse_errors.deferred = None
+
+
+class ErrorRateExceeded(Exception):
+    def __init__(self, lines: int, errors: int) -> None:
+        super().__init__(lines, errors)
+        self.lines = lines
+        self.errors = errors
+
+    def __str__(self) -> str:
+        return f"{self.errors} of {self.lines} lines failed to parse"
+
+
+class ErrorRateParser:
+    """Обёртка парсера: считает строки и ошибки и прерывает разбор, если ошибок слишком много."""
+
+    def __init__(self, parser: Parser, threshold: float, min_lines: int = ERROR_MIN_LINES) -> None:
+        self.parser = parser
+        self.threshold = threshold
+        self.min_lines = min_lines
+        self.lines = 0
+        self.errors = 0
+
+    def __call__(self, line: bytes) -> tuple[bytes, float] | None:
+        self.lines += 1
+        parsed_line = self.parser(line)
+        if parsed_line is None:
+            self.errors += 1
+            if self.lines >= self.min_lines and self.errors > self.threshold * self.lines:
+                raise ErrorRateExceeded(self.lines, self.errors)
+        return parsed_line
+
+
+def prescan(path: str, parser: Parser, sample_size: int, threshold: float) -> None:
+    """Проверка формата по выборке строк; ошибки выборки не попадают в parse_errors.
+
+    parser должен быть «голым» (без нормализации URL): для выборки она не нужна и только
+    заполняет её LRU-кэш.
+    """
+    lines = sample_lines(path, sample_size)
+    with parse_errors.muted():
+        errors = sum(1 for line in lines if parser(line) is None)
+    if lines and errors > threshold * len(lines):
+        raise ErrorRateExceeded(len(lines), errors)
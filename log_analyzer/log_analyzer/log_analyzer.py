@@ -3,24 +3,67 @@
 #                     '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
 #                     '$request_time';
 import argparse
+import atexit
+import datetime
 import gzip
+import io
 import json
 import logging
+import multiprocessing
 import os
 import re
 import sys
 
-from collections.abc import Callable, Iterator
+from collections.abc import Callable, Iterable, Iterator
+from functools import lru_cache
 from json import dumps
-from logging.handlers import RotatingFileHandler
-from pathlib import Path
-from statistics import median
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from types import TracebackType
 from typing import Any
 
 import structlog
 
-config: dict[str, int | str] = {"REPORT_SIZE": 1000, "REPORT_DIR": "./reports", "LOG_DIR": "./log"}
+from .aggregate import DEFAULT_MEDIAN_ERROR, LogAggregate, Parser, aggregate_lines
+from .columnar import export_columns
+from .decompress import iter_lines, open_log
+from .errors import (
+    ERROR_LOG_INTERVAL,
+    ERROR_MIN_LINES,
+    ERROR_SAMPLES,
+    ERROR_THRESHOLD,
+    ErrorRateExceeded,
+    ErrorRateParser,
+    parse_errors,
+    prescan,
+)
+from .multiday import range_aggregate
+from .normalize import NormalizingParser, UrlNormalizer
+from .numpy_engine import NumpyAggregate, numpy_aggregate_lines
+from .parallel import parallel_aggregate
+from .state import incremental_aggregate
+
+config: dict[str, Any] = {
+    "REPORT_SIZE": 1000,
+    "REPORT_DIR": "./reports",
+    "LOG_DIR": "./log",
+    "MEDIAN_ERROR": DEFAULT_MEDIAN_ERROR,
+    "WORKERS": 1,
+    "STATE_FILE": "",
+    "CACHE_DIR": "./cache",
+    "DATE_FROM": "",
+    "DATE_TO": "",
+    "URL_NORMALIZE": False,
+    "URL_RULES": [],
+    "MAX_URLS": 0,
+    "REPORT_GZIP": False,
+    "REPORT_COLUMNS": False,
+    "ENGINE": "python",
+    "ERROR_SAMPLES": ERROR_SAMPLES,
+    "ERROR_LOG_INTERVAL": ERROR_LOG_INTERVAL,
+    "ERROR_THRESHOLD": ERROR_THRESHOLD,
+    "ERROR_MIN_LINES": ERROR_MIN_LINES,
+    "PRESCAN_LINES": 0,
+}
 
 FILE_NAME_PATTERN = re.compile(r"nginx-access-ui.log-(\d+)(\.\S+)?$")
 # FILE_NAME_PATTERN = re.compile(r'nginx-access-ui.log-(\d+)(\.gz)?$')
@@ -28,6 +71,12 @@ LOG_PATTERN = re.compile(
     r'^\S+\s+\S+\s+\S+\s+\[[^]]*]\s+"([^"]*)"\s+\S+\s+\S+\s+"[^"]*"\s+"[^"]*"\s+"[^"]*"\s+"[^"]*"\s+"[^"]*"\s+(\d+\.\d+)'
 )
 REQUEST_PATTERN = re.compile(r"^\S+\s+(\S+)")
+LOG_PATTERN_BYTES = re.compile(
+    rb'^\S+\s+\S+\s+\S+\s+\[[^]]*]\s+"[^"\s]+\s+([^"\s]+)[^"]*"\s+\S+\s+\S+\s+"[^"]*"\s+"[^"]*"\s+"[^"]*"\s+"[^"]*"\s+"[^"]*"\s+(\d+\.\d+)'
+)
+
+log = structlog.get_logger()
+_log_listener: QueueListener | None = None
 
 
 def handle_exception(
@@ -39,6 +88,13 @@ def handle_exception(
     )
 
 
+def stop_log_listener() -> None:
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
 def configure_structlog(log_path: str | None, level: str = "info") -> None:
     level_map = {
         "debug": logging.DEBUG,
@@ -48,6 +104,9 @@ def configure_structlog(log_path: str | None, level: str = "info") -> None:
 
     log_level = level_map.get(level.lower(), logging.INFO)
 
+    global _log_listener
+    stop_log_listener()
+
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
     root_logger.handlers.clear()
@@ -63,7 +122,14 @@ def configure_structlog(log_path: str | None, level: str = "info") -> None:
         else logging.StreamHandler(sys.stdout)
     )
 
-    root_logger.addHandler(handler)
+    # Запись в файл (с ротацией) уходит в поток слушателя, разбор на ней не ждёт.
+    # Очередь из multiprocessing, чтобы записи доходили и из форкнутых воркеров.
+    log_queue: multiprocessing.Queue[logging.LogRecord] = multiprocessing.Queue(-1)
+    _log_listener = QueueListener(log_queue, handler)
+    _log_listener.start()
+    atexit.unregister(stop_log_listener)
+    atexit.register(stop_log_listener)
+    root_logger.addHandler(QueueHandler(log_queue))
 
     structlog_processors: list[Callable[..., Any]] = [
         structlog.processors.add_log_level,
@@ -81,13 +147,39 @@ def configure_structlog(log_path: str | None, level: str = "info") -> None:
     )
 
 
-def config_parser(default_config: dict[str, int | str]) -> dict[str, int | str] | None:
+def date_arg(value: str) -> str:
+    return datetime.datetime.strptime(value, "%Y%m%d").strftime("%Y%m%d")
+
+
+def config_parser(
+    default_config: dict[str, Any],
+) -> dict[str, Any] | None:
     parser = argparse.ArgumentParser(description="Скрипт для загрузки конфига из файла")
     parser.add_argument(
         "--config",
         help="Путь к файлу конфигурации",
         default=r"C:\Users\admin\PycharmProjects\Python_Professional_OTUS\log_analyzer\config\config.json",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Количество процессов для разбора лога",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["python", "numpy"],
+        help="Движок агрегации: python (потоковый) или numpy (векторный, точные медианы)",
+    )
+    parser.add_argument(
+        "--date-from",
+        type=date_arg,
+        help="Начало периода для отчёта по нескольким логам (YYYYMMDD)",
+    )
+    parser.add_argument(
+        "--date-to",
+        type=date_arg,
+        help="Конец периода для отчёта по нескольким логам (YYYYMMDD)",
+    )
     args = parser.parse_args()
     config_path = args.config
 
@@ -95,6 +187,14 @@ def config_parser(default_config: dict[str, int | str]) -> dict[str, int | str]
         with open(config_path, encoding="utf-8") as file:
             new_config = json.load(file)
             config.update(new_config)
+            if args.workers:
+                config["WORKERS"] = args.workers
+            if args.engine:
+                config["ENGINE"] = args.engine
+            if args.date_from:
+                config["DATE_FROM"] = args.date_from
+            if args.date_to:
+                config["DATE_TO"] = args.date_to
             return default_config
     else:
         log.error("Oh shit! I'm sorry! There is no such file")
@@ -105,13 +205,13 @@ def parse_line(line: str) -> dict[str, str] | None:
     pattern_match = LOG_PATTERN.match(line)
 
     if not pattern_match:
-        log.error("Oh shit! I'm sorry! There is no such line", line=line)
+        parse_errors.record("format", line)
         return None
 
     request = pattern_match.group(1)
     request_match = REQUEST_PATTERN.match(request)
     if not request_match:
-        log.error("Oh shit! I'm sorry! There is no such line", request=request)
+        parse_errors.record("request", request)
         return None
 
     request_time = pattern_match.group(2)
@@ -119,55 +219,32 @@ def parse_line(line: str) -> dict[str, str] | None:
     return {"url": request_match.group(1), "request_time": request_time}
 
 
+def parse_line_bytes(line: bytes) -> tuple[bytes, float] | None:
+    pattern_match = LOG_PATTERN_BYTES.match(line)
+
+    if not pattern_match:
+        parse_errors.record("format", line)
+        return None
+
+    return pattern_match.group(1), float(pattern_match.group(2))
+
+
 def report_maker(
-    source: Iterator[str], parser: Callable[[str], dict[str, str] | None], report_size: int
+    source: Iterable[str],
+    parser: Callable[[str], dict[str, str] | None],
+    report_size: int,
+    median_error: float = DEFAULT_MEDIAN_ERROR,
 ) -> list[dict[str, int | float | str]]:
-    urls: dict[str, list[float]] = {}
-    result: list[dict[str, int | float | str]] = []
-
-    count_all: int = 0
-    time_all: int | float = 0
+    aggregate = LogAggregate(median_error)
 
     for line in source:
         parsed_line = parser(line)
         if not parsed_line:
             continue
 
-        url = parsed_line["url"]
-
-        times = float(parsed_line["request_time"])
-
-        urls.setdefault(url, []).append(times)
-
-    for url, time in urls.items():
-        count: int = len(time)
-        time_sum: float = sum(time)
-        time_avg: float = time_sum / count
-        time_max: float = max(time)
-        time_med: float = median(time)
-        count_all += count
-        time_all += time_sum
-
-        result.append(
-            {
-                "url": url,
-                "count": count,
-                "time_sum": round(time_sum, 3),
-                "time_avg": round(time_avg, 3),
-                "time_max": time_max,
-                "time_med": round(time_med, 3),
-            }
-        )
-
-    for some_url in result:
-        if count_all > 0:
-            some_url.update({"count_perc": round(((int(some_url["count"]) * 100) / count_all), 3)})
-        if time_all > 0:
-            some_url.update(
-                {"time_perc": round(((float(some_url["time_sum"]) * 100) / time_all), 3)}
-            )
+        aggregate.add(parsed_line["url"], float(parsed_line["request_time"]))
 
-    return sorted(result, key=lambda d: d["time_sum"], reverse=True)[:report_size]
+    return aggregate.report(report_size)
 
 
 def read_lines(path: str | None, encoding: str = "utf-8") -> Iterator[str]:
@@ -175,14 +252,18 @@ def read_lines(path: str | None, encoding: str = "utf-8") -> Iterator[str]:
         log.error("Oh shit! I'm sorry! There is no such path to log file")
         return None
     log.info("Yeah, beach! This script is starting to read some shit!")
-    with (
-        gzip.open(path, "rt", encoding=encoding)
-        if Path(path).suffix == ".gz"
-        else open(path, encoding=encoding) as file
-    ):
+    with io.TextIOWrapper(open_log(path), encoding=encoding) as file:
         yield from file
 
 
+def read_lines_bytes(path: str | None) -> Iterator[bytes]:
+    if not path:
+        log.error("Oh shit! I'm sorry! There is no such path to log file")
+        return None
+    log.info("Yeah, beach! This script is starting to read some shit!")
+    yield from iter_lines(path)
+
+
 def find_latest_log(path: str) -> str | None:
     log_files = [
         os.path.join(path + file) for file in os.listdir(path) if FILE_NAME_PATTERN.match(file)
@@ -195,37 +276,154 @@ def find_latest_log(path: str) -> str | None:
         return None
 
 
-def write_report(file: str, template: str, data: str) -> None:
+def find_logs_in_range(path: str, date_from: str, date_to: str) -> list[str]:
+    log_files = []
+    for file in os.listdir(path):
+        file_match = FILE_NAME_PATTERN.match(file)
+        if not file_match:
+            continue
+        date = file_match.group(1)
+        if (not date_from or date >= date_from) and (not date_to or date <= date_to):
+            log_files.append(os.path.join(path + file))
+    log_files = sorted(file for file in log_files if os.path.isfile(file))
+    if not log_files:
+        log.info("There is no shit you are looking for")
+    return log_files
+
+
+@lru_cache(maxsize=8)
+def _split_template(template: str, mtime_ns: int) -> tuple[str, str, str]:
     with open(template, encoding="utf-8") as f:
-        body = f.read()
-    body = body.replace("$table_json", data)
+        return f.read().partition("$table_json")
+
+
+def split_template(template: str) -> tuple[str, str]:
+    head, placeholder, tail = _split_template(template, os.stat(template).st_mtime_ns)
+    if not placeholder:
+        raise ValueError(f"There is no $table_json in report template {template}")
+    return head, tail
+
+
+def write_report(
+    file: str,
+    template: str,
+    data: str | Iterable[dict[str, Any]],
+    compress: bool = False,
+) -> None:
+    head, tail = split_template(template)
     os.makedirs(os.path.dirname(file), exist_ok=True)
-    with open(file, "w", encoding="utf-8") as f:
-        f.write(body)
+    target = file + ".gz" if compress else file
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+
+    try:
+        with (
+            gzip.open(tmp_path, "wt", encoding="utf-8")
+            if compress
+            else open(tmp_path, "w", encoding="utf-8") as f
+        ):
+            f.write(head)
+            if isinstance(data, str):
+                f.write(data)
+            else:
+                f.write("[")
+                for i, row in enumerate(data):
+                    if i:
+                        f.write(", ")
+                    f.write(dumps(row))
+                f.write("]")
+            f.write(tail)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def make_parser(settings: dict[str, Any]) -> Parser:
+    if not settings["URL_NORMALIZE"] and not settings["URL_RULES"]:
+        return parse_line_bytes
+    normalizer = UrlNormalizer(
+        rules=[(pattern, repl) for pattern, repl in settings["URL_RULES"]],
+        strip_query=bool(settings["URL_NORMALIZE"]),
+        collapse_ids=bool(settings["URL_NORMALIZE"]),
+    )
+    return NormalizingParser(parse_line_bytes, normalizer)
 
 
 def main() -> None:
     if not config_parser(config):
         sys.exit()
 
+    workers = int(config["WORKERS"])
+    median_error = float(config["MEDIAN_ERROR"])
+    log_dir = os.path.join(str(config["LOG_DIR"]) + "/")
+    date_from, date_to = str(config["DATE_FROM"]), str(config["DATE_TO"])
+    line_parser = make_parser(config)
+    parse_errors.samples = int(config["ERROR_SAMPLES"])
+    parse_errors.interval = float(config["ERROR_LOG_INTERVAL"])
+
     try:
-        log_file = find_latest_log(os.path.join(str(config["LOG_DIR"]) + "/"))
+        if date_from or date_to:
+            log_files = find_logs_in_range(log_dir, date_from, date_to)
+        else:
+            latest_log = find_latest_log(log_dir)
+            log_files = [latest_log] if latest_log else []
     except FileNotFoundError as e:
         log.error("Oh shit! I'm sorry! There is no such path to log file", e=e)
         sys.exit()
+    log_file = log_files[-1] if log_files else None
     if not log_file:
         log.error("Oh shit! I'm sorry! There is no file to analyze")
-    report = report_maker(read_lines(log_file), parse_line, int(config["REPORT_SIZE"]))
+    error_threshold = float(config["ERROR_THRESHOLD"])
+    aggregate: LogAggregate | NumpyAggregate
+    try:
+        if error_threshold and config["PRESCAN_LINES"]:
+            for path in log_files:
+                prescan(path, parse_line_bytes, int(config["PRESCAN_LINES"]), error_threshold)
+        if error_threshold:
+            line_parser = ErrorRateParser(
+                line_parser, error_threshold, int(config["ERROR_MIN_LINES"])
+            )
 
-    write_report(
-        os.path.join(str(config["REPORT_DIR"]) + "/report.html"),
-        "C:/Users/admin/PycharmProjects/Python_Professional_OTUS/log_analyzer/templates/report.html",
-        dumps(report),
-    )
+        if (date_from or date_to) and log_file:
+            aggregate = range_aggregate(
+                log_files, str(config["CACHE_DIR"]), line_parser, median_error, workers
+            )
+        elif config["STATE_FILE"] and log_file:
+            aggregate = incremental_aggregate(
+                log_file, str(config["STATE_FILE"]), line_parser, median_error, workers
+            )
+        elif config["ENGINE"] == "numpy":
+            aggregate = numpy_aggregate_lines(read_lines_bytes(log_file), line_parser)
+        elif workers > 1 and log_file:
+            aggregate = parallel_aggregate(log_file, line_parser, workers, median_error)
+        else:
+            aggregate = aggregate_lines(read_lines_bytes(log_file), line_parser, median_error)
+    except ErrorRateExceeded as e:
+        parse_errors.summary()
+        log.error(
+            "Oh shit! I'm sorry! Too many lines failed to parse", lines=e.lines, errors=e.errors
+        )
+        sys.exit(1)
+    parse_errors.summary()
+    aggregate.limit(int(config["MAX_URLS"]))
+    report = aggregate.report(int(config["REPORT_SIZE"]))
+
+    try:
+        write_report(
+            os.path.join(str(config["REPORT_DIR"]) + "/report.html"),
+            "C:/Users/admin/PycharmProjects/Python_Professional_OTUS/log_analyzer/templates/report.html",
+            report,
+            compress=bool(config["REPORT_GZIP"]),
+        )
+    except ValueError as e:
+        log.error("Oh shit! I'm sorry! Report template is broken", e=e)
+        sys.exit(1)
+    if config["REPORT_COLUMNS"]:
+        export_columns(os.path.join(str(config["REPORT_DIR"]) + "/report.cols"), report)
 
 
 if __name__ == "__main__":
     configure_structlog(str(config["LOG_DIR"]), level="info")
-    log = structlog.get_logger()
     sys.excepthook = handle_exception
     main()
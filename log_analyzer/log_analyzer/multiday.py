@@ -0,0 +1,82 @@
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .aggregate import DEFAULT_MEDIAN_ERROR, LogAggregate, Parser
+from .errors import collect_parse_errors
+from .normalize import RAW_URL_FINGERPRINT, parser_fingerprint
+from .parallel import aggregate_file, merge_worker_result
+from .state import write_json_atomic
+
+
+def cache_file_for(cache_dir: str, path: str, url_fingerprint: str = RAW_URL_FINGERPRINT) -> str:
+    # Дни, сведённые с другими настройками нормализации URL, лежат под другими именами.
+    name = f"{Path(path).name}.{os.stat(path).st_mtime_ns}.{url_fingerprint}.json"
+    return os.path.join(cache_dir, name)
+
+
+def load_cached(cache_file: str, median_error: float) -> LogAggregate | None:
+    try:
+        with open(cache_file, encoding="utf-8") as file:
+            aggregate = LogAggregate.from_dict(json.load(file))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if aggregate.median_error != median_error:
+        return None
+    return aggregate
+
+
+def cached_aggregate_file(
+    path: str, cache_dir: str, parser: Parser, median_error: float = DEFAULT_MEDIAN_ERROR
+) -> LogAggregate:
+    aggregate = aggregate_file(path, parser, median_error)
+    write_json_atomic(
+        cache_file_for(cache_dir, path, parser_fingerprint(parser)), aggregate.to_dict()
+    )
+    return aggregate
+
+
+def range_aggregate(
+    paths: list[str],
+    cache_dir: str,
+    parser: Parser,
+    median_error: float = DEFAULT_MEDIAN_ERROR,
+    workers: int = 1,
+) -> LogAggregate:
+    result = LogAggregate(median_error)
+    missing = []
+    url_fingerprint = parser_fingerprint(parser)
+
+    for path in paths:
+        cached = load_cached(cache_file_for(cache_dir, path, url_fingerprint), median_error)
+        if cached is None:
+            missing.append(path)
+        else:
+            result.merge(cached)
+
+    if workers > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    collect_parse_errors,
+                    cached_aggregate_file,
+                    path,
+                    cache_dir,
+                    parser,
+                    median_error,
+                )
+                for path in missing
+            ]
+            try:
+                for future in as_completed(futures):
+                    merge_worker_result(result, future)
+            except BaseException:
+                pool.shutdown(cancel_futures=True)
+                raise
+    else:
+        for path in missing:
+            result.merge(cached_aggregate_file(path, cache_dir, parser, median_error))
+
+    return result
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import re
+
+from collections.abc import Callable, Iterable
+from functools import lru_cache
+from typing import Any
+
+from .aggregate import Parser
+
+DEFAULT_CACHE_SIZE = 100_000
+RAW_URL_FINGERPRINT = "raw"
+
+NUMERIC_SEGMENT = re.compile(rb"/\d+(?=/|$)")
+UUID_SEGMENT = re.compile(
+    rb"/[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)"
+)
+
+
+class UrlNormalizer:
+    def __init__(
+        self,
+        rules: Iterable[tuple[str, str]] = (),
+        strip_query: bool = True,
+        collapse_ids: bool = True,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        self.rules = [(re.compile(pattern.encode()), repl.encode()) for pattern, repl in rules]
+        self.strip_query = strip_query
+        self.collapse_ids = collapse_ids
+        self.cache_size = cache_size
+        self._cached: Callable[[bytes], bytes] = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _normalize(self, url: bytes) -> bytes:
+        if self.strip_query:
+            url = url.partition(b"?")[0]
+        if self.collapse_ids:
+            url = UUID_SEGMENT.sub(b"/{uuid}", url)
+            url = NUMERIC_SEGMENT.sub(b"/{id}", url)
+        for pattern, repl in self.rules:
+            url = pattern.sub(repl, url)
+        return url
+
+    def __call__(self, url: bytes) -> bytes:
+        return self._cached(url)
+
+    def fingerprint(self) -> str:
+        settings = {
+            "rules": [[pattern.pattern.decode(), repl.decode()] for pattern, repl in self.rules],
+            "strip_query": self.strip_query,
+            "collapse_ids": self.collapse_ids,
+        }
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_cached"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._cached = lru_cache(maxsize=self.cache_size)(self._normalize)
+
+
+class NormalizingParser:
+    def __init__(self, parser: Parser, normalizer: UrlNormalizer) -> None:
+        self.parser = parser
+        self.normalizer = normalizer
+
+    def __call__(self, line: bytes) -> tuple[bytes, float] | None:
+        parsed_line = self.parser(line)
+        if parsed_line is None:
+            return None
+        return self.normalizer(parsed_line[0]), parsed_line[1]
+
+
+def parser_fingerprint(parser: Parser) -> str:
+    """Отпечаток настроек нормализации URL, с которыми работает parser (обёртки разворачиваются)."""
+    while True:
+        normalizer = getattr(parser, "normalizer", None)
+        if isinstance(normalizer, UrlNormalizer):
+            return normalizer.fingerprint()
+        inner = getattr(parser, "parser", None)
+        if inner is None:
+            return RAW_URL_FINGERPRINT
+        parser = inner
@@ -0,0 +1,156 @@
+import heapq
+
+from array import array
+from collections.abc import Iterable
+from typing import Any
+
+from .aggregate import OTHER_URL, PERCENTILES, Parser, Url, linear_quantile
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover - numpy is optional
+    HAS_NUMPY = False
+
+BATCH_SIZE = 1 << 16
+
+
+class NumpyAggregate:
+    """Движок на numpy: времена копятся чанками массивов, статистика считается group-by."""
+
+    def __init__(self, batch_size: int = BATCH_SIZE) -> None:
+        if not HAS_NUMPY:
+            raise RuntimeError("Для движка numpy нужен пакет numpy")
+        self.batch_size = batch_size
+        self.url_ids: dict[Url, int] = {}
+        self._ids = array("i")
+        self._times = array("d")
+        self._chunks: list[tuple[Any, Any]] = []
+
+    def add(self, url: Url, request_time: float) -> None:
+        url_id = self.url_ids.get(url)
+        if url_id is None:
+            url_id = self.url_ids[url] = len(self.url_ids)
+        self._ids.append(url_id)
+        self._times.append(request_time)
+        if len(self._ids) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._ids:
+            self._chunks.append(
+                (np.frombuffer(self._ids, dtype=np.int32), np.frombuffer(self._times))
+            )
+            self._ids, self._times = array("i"), array("d")
+
+    def _columns(self) -> tuple[Any, Any]:
+        self._flush()
+        if not self._chunks:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        if len(self._chunks) > 1:
+            ids = np.concatenate([ids for ids, _ in self._chunks])
+            times = np.concatenate([times for _, times in self._chunks])
+            self._chunks = [(ids, times)]
+        return self._chunks[0]
+
+    def merge(self, other: "NumpyAggregate") -> None:
+        other_ids, other_times = other._columns()
+        remap = np.empty(len(other.url_ids), dtype=np.int32)
+        for url, other_id in other.url_ids.items():
+            url_id = self.url_ids.get(url)
+            if url_id is None:
+                url_id = self.url_ids[url] = len(self.url_ids)
+            remap[other_id] = url_id
+        self._flush()
+        self._chunks.append((remap[other_ids], other_times))
+
+    def limit(self, max_urls: int) -> None:
+        if not max_urls or len(self.url_ids) <= max_urls:
+            return
+        ids, times = self._columns()
+        urls = list(self.url_ids)
+        sums = np.bincount(ids, weights=times, minlength=len(urls)).tolist()
+
+        other_url: Url = OTHER_URL if isinstance(urls[0], bytes) else OTHER_URL.decode()
+        other_id = self.url_ids.get(other_url)
+        candidates = [url_id for url_id in range(len(urls)) if url_id != other_id]
+        keep = heapq.nlargest(max_urls, candidates, key=sums.__getitem__)
+
+        remap = np.full(len(urls), len(keep), dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+        self.url_ids = {urls[url_id]: new_id for new_id, url_id in enumerate(keep)}
+        self.url_ids[other_url] = len(keep)
+        self._chunks = [(remap[ids], times)]
+
+    def report(self, report_size: int) -> list[dict[str, int | float | str]]:
+        ids, times = self._columns()
+        urls = list(self.url_ids)
+        size = len(urls)
+
+        counts = np.bincount(ids, minlength=size).tolist()
+        sums = np.bincount(ids, weights=times, minlength=size).tolist()
+        maxs = np.zeros(size)
+        np.maximum.at(maxs, ids, times)
+
+        count_all: int = 0
+        time_all: int | float = 0
+        for url_id in range(size):
+            count_all += counts[url_id]
+            time_all += sums[url_id]
+
+        rounded = [round(time_sum, 3) for time_sum in sums]
+        top = heapq.nlargest(report_size, range(size), key=rounded.__getitem__)
+
+        top_ids = np.array(top, dtype=np.int32)
+        mask = np.isin(ids, top_ids)
+        top_line_ids, top_times = ids[mask], times[mask]
+        order = np.lexsort((top_times, top_line_ids))
+        sorted_times = top_times[order].tolist()
+        starts = dict(
+            zip(
+                *np.unique(top_line_ids[order], return_index=True),
+                strict=True,
+            )
+        )
+
+        result: list[dict[str, int | float | str]] = []
+        for url_id in top:
+            url, count, time_sum = urls[url_id], counts[url_id], rounded[url_id]
+            start = int(starts[url_id])
+            middle = start + count // 2
+            if count % 2:
+                time_med = sorted_times[middle]
+            else:
+                time_med = (sorted_times[middle - 1] + sorted_times[middle]) / 2
+            row: dict[str, int | float | str] = {
+                "url": url.decode("utf-8", errors="replace") if isinstance(url, bytes) else url,
+                "count": count,
+                "time_sum": time_sum,
+                "time_avg": round(sums[url_id] / count, 3),
+                "time_max": float(maxs[url_id]),
+                "time_med": round(time_med, 3),
+            }
+            url_times = sorted_times[start : start + count]
+            for percentile in PERCENTILES:
+                row[f"time_p{percentile}"] = round(linear_quantile(url_times, percentile / 100), 3)
+            if count_all > 0:
+                row["count_perc"] = round(((count * 100) / count_all), 3)
+            if time_all > 0:
+                row["time_perc"] = round(((time_sum * 100) / time_all), 3)
+            result.append(row)
+
+        return result
+
+
+def numpy_aggregate_lines(
+    source: Iterable[bytes], parser: Parser, batch_size: int = BATCH_SIZE
+) -> NumpyAggregate:
+    aggregate = NumpyAggregate(batch_size)
+
+    for line in source:
+        parsed_line = parser(line)
+        if parsed_line:
+            aggregate.add(*parsed_line)
+
+    return aggregate
@@ -0,0 +1,117 @@
+import os
+
+from collections import Counter
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+
+from .aggregate import DEFAULT_MEDIAN_ERROR, LogAggregate, Parser, aggregate_lines
+from .decompress import is_compressed, iter_lines, iter_lines_mmap, open_log
+from .errors import Samples, collect_parse_errors, parse_errors
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def split_ranges(
+    path: str, workers: int, start: int = 0, end: int | None = None
+) -> list[tuple[int, int]]:
+    size = os.path.getsize(path) if end is None else end
+    step = max(1, -(-(size - start) // max(1, workers)))
+    boundaries = [start]
+
+    with open(path, "rb") as file:
+        while boundaries[-1] + step < size:
+            file.seek(boundaries[-1] + step)
+            file.readline()
+            position = file.tell()
+            if position >= size:
+                break
+            boundaries.append(position)
+
+    if size > start:
+        boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:], strict=False))
+
+
+def aggregate_chunk(
+    chunk: bytes, parser: Parser, median_error: float = DEFAULT_MEDIAN_ERROR
+) -> LogAggregate:
+    return aggregate_lines(chunk.splitlines(keepends=True), parser, median_error)
+
+
+def aggregate_range(
+    path: str, start: int, end: int, parser: Parser, median_error: float = DEFAULT_MEDIAN_ERROR
+) -> LogAggregate:
+    return aggregate_lines(iter_lines_mmap(path, start, end), parser, median_error)
+
+
+def aggregate_file(
+    path: str, parser: Parser, median_error: float = DEFAULT_MEDIAN_ERROR
+) -> LogAggregate:
+    return aggregate_lines(iter_lines(path), parser, median_error)
+
+
+def iter_chunks(path: str, chunk_size: int = CHUNK_SIZE, start: int = 0) -> Iterator[bytes]:
+    with open_log(path) as file:
+        file.seek(start)
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk + file.readline()
+
+
+def merge_worker_result(
+    result: LogAggregate, future: "Future[tuple[LogAggregate, Counter[str], Samples]]"
+) -> None:
+    aggregate, counts, samples = future.result()
+    parse_errors.merge(counts, samples)
+    result.merge(aggregate)
+
+
+def parallel_aggregate(
+    path: str,
+    parser: Parser,
+    workers: int,
+    median_error: float = DEFAULT_MEDIAN_ERROR,
+    chunk_size: int = CHUNK_SIZE,
+    start: int = 0,
+    end: int | None = None,
+) -> LogAggregate:
+    result = LogAggregate(median_error)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            if not is_compressed(path):
+                futures = [
+                    pool.submit(
+                        collect_parse_errors,
+                        aggregate_range,
+                        path,
+                        range_start,
+                        range_end,
+                        parser,
+                        median_error,
+                    )
+                    for range_start, range_end in split_ranges(path, workers, start, end)
+                ]
+                for future in as_completed(futures):
+                    merge_worker_result(result, future)
+                return result
+
+            pending: set[Future[tuple[LogAggregate, Counter[str], Samples]]] = set()
+            for chunk in iter_chunks(path, chunk_size, start):
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge_worker_result(result, future)
+                pending.add(
+                    pool.submit(collect_parse_errors, aggregate_chunk, chunk, parser, median_error)
+                )
+            for future in as_completed(pending):
+                merge_worker_result(result, future)
+        except BaseException:
+            # Анализ прерван (например, ErrorRateExceeded): ещё не начатые диапазоны и куски отменяем.
+            pool.shutdown(cancel_futures=True)
+            raise
+
+    return result
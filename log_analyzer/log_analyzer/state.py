@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+
+from dataclasses import dataclass
+from typing import Any
+
+from .aggregate import DEFAULT_MEDIAN_ERROR, LogAggregate, Parser
+from .decompress import is_compressed
+from .normalize import RAW_URL_FINGERPRINT, parser_fingerprint
+from .parallel import aggregate_file, aggregate_range, parallel_aggregate
+
+STATE_VERSION = 1
+DIGEST_BYTES = 4096
+
+
+@dataclass
+class SourceIdentity:
+    path: str
+    device: int
+    inode: int
+    size: int
+    mtime: float
+
+    @classmethod
+    def of(cls, path: str) -> "SourceIdentity":
+        stat = os.stat(path)
+        return cls(path, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+@dataclass
+class Checkpoint:
+    source: SourceIdentity
+    offset: int
+    aggregate: LogAggregate
+    url_fingerprint: str = RAW_URL_FINGERPRINT
+    content_digest: str = ""
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "version": STATE_VERSION,
+            "source": vars(self.source),
+            "offset": self.offset,
+            "aggregate": self.aggregate.to_dict(),
+            "url_fingerprint": self.url_fingerprint,
+            "content_digest": self.content_digest,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Checkpoint":
+        return cls(
+            SourceIdentity(**data["source"]),
+            data["offset"],
+            LogAggregate.from_dict(data["aggregate"]),
+            data.get("url_fingerprint", ""),
+            data.get("content_digest", ""),
+        )
+
+
+def load_checkpoint(state_path: str) -> Checkpoint | None:
+    try:
+        with open(state_path, encoding="utf-8") as file:
+            data = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if data.get("version") != STATE_VERSION:
+        return None
+    return Checkpoint.from_dict(data)
+
+
+def write_json_atomic(path: str, data: dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def save_checkpoint(state_path: str, checkpoint: Checkpoint) -> None:
+    write_json_atomic(state_path, checkpoint.to_dict())
+
+
+def content_digest(path: str, offset: int) -> str:
+    """Отпечаток первых DIGEST_BYTES байт файла и DIGEST_BYTES байт перед offset.
+
+    Ловит файл, который обрезали или переписали на месте (copytruncate, тот же inode) и который
+    успел снова вырасти за старое смещение.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        digest.update(file.read(min(offset, DIGEST_BYTES)))
+        tail_start = max(offset - DIGEST_BYTES, 0)
+        file.seek(tail_start)
+        digest.update(file.read(offset - tail_start))
+    return digest.hexdigest()
+
+
+def resume_offset(
+    checkpoint: Checkpoint,
+    identity: SourceIdentity,
+    median_error: float,
+    url_fingerprint: str = RAW_URL_FINGERPRINT,
+) -> int:
+    saved = checkpoint.source
+    if checkpoint.aggregate.median_error != median_error:
+        return 0
+    if checkpoint.url_fingerprint != url_fingerprint:
+        return 0
+    if (saved.device, saved.inode) != (identity.device, identity.inode):
+        return 0
+    if is_compressed(identity.path):
+        if saved.size != identity.size:
+            return 0
+    elif identity.size < checkpoint.offset:
+        return 0
+    if checkpoint.content_digest != content_digest(identity.path, checkpoint.offset):
+        return 0
+    return checkpoint.offset
+
+
+def last_line_end(path: str, size: int) -> int:
+    with open(path, "rb") as file:
+        position = size
+        while position > 0:
+            step = min(position, 64 * 1024)
+            file.seek(position - step)
+            block = file.read(step)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+
+def incremental_aggregate(
+    path: str,
+    state_path: str,
+    parser: Parser,
+    median_error: float = DEFAULT_MEDIAN_ERROR,
+    workers: int = 1,
+) -> LogAggregate:
+    identity = SourceIdentity.of(path)
+    url_fingerprint = parser_fingerprint(parser)
+    checkpoint = load_checkpoint(state_path)
+
+    offset = 0
+    aggregate = LogAggregate(median_error)
+    if checkpoint is not None:
+        offset = resume_offset(checkpoint, identity, median_error, url_fingerprint)
+        if offset:
+            aggregate = checkpoint.aggregate
+
+    if is_compressed(path):
+        if offset:
+            return aggregate
+        end = identity.size
+        if workers > 1:
+            aggregate = parallel_aggregate(path, parser, workers, median_error)
+        else:
+            aggregate = aggregate_file(path, parser, median_error)
+    else:
+        end = last_line_end(path, identity.size)
+        if end <= offset:
+            return aggregate
+        if workers > 1:
+            new = parallel_aggregate(path, parser, workers, median_error, start=offset, end=end)
+        else:
+            new = aggregate_range(path, offset, end, parser, median_error)
+        aggregate.merge(new)
+
+    digest = content_digest(path, end)
+    save_checkpoint(state_path, Checkpoint(identity, end, aggregate, url_fingerprint, digest))
+    return aggregate
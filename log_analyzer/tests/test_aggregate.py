@@ -0,0 +1,203 @@
+import random
+
+from statistics import median, quantiles
+
+import pytest
+
+import log_analyzer.log_analyzer.log_analyzer as m
+
+from log_analyzer.log_analyzer.aggregate import (
+    DEFAULT_MEDIAN_ERROR,
+    PERCENTILES,
+    ExactSamples,
+    LogAggregate,
+    QuantileSketch,
+)
+
+
+def test_quantile_sketch_median_within_error():
+    rnd = random.Random(42)
+    values = [round(rnd.lognormvariate(-2, 1), 3) for _ in range(10_000)]
+
+    sketch = QuantileSketch(relative_error=0.01)
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.count == len(values)
+    assert sketch.median() == pytest.approx(median(values), rel=0.02)
+
+
+@pytest.mark.parametrize(
+    "values", [[0.1, 0.3], [0.2, 0.2, 1.0, 5.0], [0.05, 0.5, 1.2, 3.0, 7.5, 9.0]]
+)
+def test_quantile_sketch_median_small_even_counts(values):
+    sketch, exact = QuantileSketch(relative_error=0.001), ExactSamples()
+    for value in values:
+        sketch.add(value)
+        exact.add(value)
+
+    assert sketch.median() == pytest.approx(exact.median(), rel=0.001)
+
+
+def test_quantile_sketch_memory_is_bounded():
+    sketch = QuantileSketch(relative_error=0.01)
+    for i in range(100_000):
+        sketch.add(0.5 + (i % 1000) / 1000)
+
+    assert len(sketch.buckets) < 100
+
+
+def test_quantile_sketch_zero_values():
+    sketch = QuantileSketch()
+    for value in (0.0, 0.0, 0.0, 1.0):
+        sketch.add(value)
+
+    assert sketch.median() == 0.0
+
+
+def test_quantile_sketch_bad_error():
+    with pytest.raises(ValueError):
+        QuantileSketch(relative_error=0)
+
+
+def test_exact_samples_median():
+    samples = ExactSamples()
+    for value in (0.1, 0.4, 0.2, 0.3):
+        samples.add(value)
+
+    assert samples.median() == median([0.1, 0.4, 0.2, 0.3])
+
+
+def test_log_aggregate_report_exact_mode():
+    aggregate = LogAggregate(median_error=0)
+    for url, value in [("/a", 1.0), ("/a", 3.0), ("/b", 0.5)]:
+        aggregate.add(url, value)
+
+    report = aggregate.report(report_size=10)
+
+    assert [row["url"] for row in report] == ["/a", "/b"]
+    assert report[0]["count"] == 2
+    assert report[0]["time_med"] == 2.0
+    assert report[0]["time_max"] == 3.0
+    assert report[0]["time_perc"] == pytest.approx(88.889)
+
+
+def test_report_maker_exact_mode(sample_line, sample_line_other_url, logger, monkeypatch):
+    monkeypatch.setattr(m, "log", logger, raising=False)
+
+    data = [sample_line, sample_line_other_url]
+    report = m.report_maker(data, m.parse_line, report_size=10, median_error=0)
+
+    assert report[0]["time_med"] == pytest.approx(0.25)
+
+
+def full_sort_report(aggregate, report_size):
+    result = []
+    count_all = sum(stats.count for stats in aggregate.urls.values())
+    time_all = sum(stats.time_sum for stats in aggregate.urls.values())
+    for url, stats in aggregate.urls.items():
+        result.append(
+            {
+                "url": url,
+                "count": stats.count,
+                "time_sum": round(stats.time_sum, 3),
+                "time_avg": round(stats.time_sum / stats.count, 3),
+                "time_max": stats.time_max,
+                "time_med": round(stats.times.median(), 3),
+                "time_p90": round(stats.times.quantile(0.9), 3),
+                "time_p95": round(stats.times.quantile(0.95), 3),
+                "time_p99": round(stats.times.quantile(0.99), 3),
+            }
+        )
+    for row in result:
+        row["count_perc"] = round(row["count"] * 100 / count_all, 3)
+        row["time_perc"] = round(row["time_sum"] * 100 / time_all, 3)
+    return sorted(result, key=lambda d: d["time_sum"], reverse=True)[:report_size]
+
+
+@pytest.mark.parametrize("median_error", [0, 0.001])
+def test_top_k_report_matches_full_sort(median_error):
+    rnd = random.Random(7)
+    aggregate = LogAggregate(median_error)
+    for _ in range(5000):
+        aggregate.add(f"/url/{rnd.randrange(300)}", rnd.choice([0.1, 0.2, 0.5, 1.0]))
+
+    assert aggregate.report(25) == full_sort_report(aggregate, 25)
+
+
+def test_medians_computed_only_for_top_k(monkeypatch):
+    aggregate = LogAggregate(median_error=0)
+    for i in range(100):
+        aggregate.add(f"/url/{i}", float(i))
+
+    calls = []
+    original = ExactSamples.median
+    monkeypatch.setattr(ExactSamples, "median", lambda self: calls.append(1) or original(self))
+
+    report = aggregate.report(5)
+
+    assert [row["url"] for row in report] == [f"/url/{i}" for i in range(99, 94, -1)]
+    assert len(calls) == 5
+
+
+def test_exact_quantile_interpolates_like_statistics():
+    rnd = random.Random(3)
+    samples = ExactSamples()
+    for _ in range(1001):
+        samples.add(rnd.expovariate(10))
+
+    expected = quantiles(samples.values, n=100, method="inclusive")
+    for percentile in (90, 95, 99):
+        assert samples.quantile(percentile / 100) == pytest.approx(expected[percentile - 1])
+    assert samples.quantile(0.5) == pytest.approx(samples.median())
+
+
+def test_sketch_percentiles_within_relative_error_after_merge():
+    rnd = random.Random(5)
+    values = [rnd.lognormvariate(-2, 1) for _ in range(20_000)]
+    parts = [QuantileSketch(0.01) for _ in range(4)]
+    for i, value in enumerate(values):
+        parts[i % 4].add(value)
+    sketch = parts[0]
+    for part in parts[1:]:
+        sketch.merge(part)
+
+    values.sort()
+    for q in (0.9, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.01)
+
+
+def test_report_has_percentile_columns():
+    aggregate = LogAggregate(median_error=0)
+    for i in range(1, 101):
+        aggregate.add("/api", i / 100)
+
+    row = aggregate.report(1)[0]
+
+    assert row["time_p90"] == pytest.approx(0.901)
+    assert row["time_p95"] == pytest.approx(0.95)
+    assert row["time_p99"] == pytest.approx(0.99)
+
+
+def test_sketch_percentiles_match_exact_for_few_hits():
+    rnd = random.Random(11)
+    samples = [[0.1, 0.3], [0.2, 0.2, 1.0, 5.0], [0.5], [0.0, 0.4, 0.9]]
+    samples += [
+        [round(rnd.expovariate(5), 3) for _ in range(rnd.randrange(2, 12))] for _ in range(20)
+    ]
+    sketch, exact = LogAggregate(DEFAULT_MEDIAN_ERROR), LogAggregate(median_error=0)
+    for i, values in enumerate(samples):
+        for value in values:
+            sketch.add(f"/url/{i}", value)
+            exact.add(f"/url/{i}", value)
+
+    for url, stats in exact.urls.items():
+        for percentile in (50, *PERCENTILES):
+            expected = stats.times.quantile(percentile / 100)
+            assert sketch.urls[url].times.quantile(percentile / 100) == pytest.approx(
+                expected, rel=DEFAULT_MEDIAN_ERROR, abs=1e-12
+            )
+
+    row = next(row for row in sketch.report(len(samples)) if row["url"] == "/url/0")
+    assert (row["time_med"], row["time_p99"]) == (0.2, 0.298)
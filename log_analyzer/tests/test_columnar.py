@@ -0,0 +1,64 @@
+import math
+
+import pytest
+
+from log_analyzer.log_analyzer.aggregate import LogAggregate
+from log_analyzer.log_analyzer.columnar import ColumnarReport, export_columns, load_columns
+
+
+@pytest.fixture
+def report():
+    aggregate = LogAggregate(median_error=0)
+    for url, value in [("/a", 1.0), ("/a", 3.0), ("/б", 0.5), ("/c", 0.25)]:
+        aggregate.add(url.encode(), value)
+    return aggregate.report(10)
+
+
+def test_columns_round_trip(tmp_path, report):
+    path = str(tmp_path / "reports" / "report.cols")
+
+    export_columns(path, report)
+
+    with load_columns(path) as columns:
+        assert columns.rows == 3
+        assert list(columns["url"]) == ["/a", "/б", "/c"]
+        assert columns["count"].format == "q"
+        assert columns["time_med"].format == "d"
+        assert columns.to_rows() == report
+
+
+def test_columns_are_zero_copy_views(tmp_path, report):
+    path = str(tmp_path / "report.cols")
+    export_columns(path, report)
+
+    with load_columns(path) as columns:
+        time_sum = columns["time_sum"]
+        assert isinstance(time_sum, memoryview)
+        assert isinstance(time_sum.obj, type(columns._mmap))
+        assert time_sum.tolist() == [row["time_sum"] for row in report]
+
+
+def test_missing_values_become_nan(tmp_path):
+    path = str(tmp_path / "report.cols")
+    export_columns(path, [{"url": "/a", "time_perc": 1.5}, {"url": "/b"}])
+
+    with load_columns(path) as columns:
+        assert columns["time_perc"][0] == 1.5
+        assert math.isnan(columns["time_perc"][1])
+
+
+def test_empty_report(tmp_path):
+    path = str(tmp_path / "report.cols")
+    export_columns(path, [])
+
+    with load_columns(path) as columns:
+        assert columns.rows == 0
+        assert columns.to_rows() == []
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / "report.html"
+    path.write_text("<html></html>", encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        ColumnarReport(str(path))
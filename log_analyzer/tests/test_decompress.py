@@ -0,0 +1,140 @@
+import bz2
+import gzip
+import lzma
+import mmap
+import threading
+
+import pytest
+
+from log_analyzer.log_analyzer.decompress import (
+    iter_lines,
+    iter_lines_mmap,
+    iter_lines_threaded,
+    open_log,
+    sample_lines,
+)
+
+PAYLOAD = b"".join(f"line {i} 0.{i:03d}\n".encode() for i in range(1000)) + b"tail without newline"
+
+WRITERS = {
+    "": lambda path, data: path.write_bytes(data),
+    ".gz": lambda path, data: path.write_bytes(gzip.compress(data)),
+    ".bz2": lambda path, data: path.write_bytes(bz2.compress(data)),
+    ".xz": lambda path, data: path.write_bytes(lzma.compress(data)),
+}
+
+
+@pytest.fixture(params=sorted(WRITERS))
+def compressed_log(request, tmp_path):
+    path = tmp_path / f"nginx-access-ui.log-20250101{request.param}"
+    WRITERS[request.param](path, PAYLOAD)
+    return str(path)
+
+
+def test_open_log_dispatches_by_suffix(compressed_log):
+    with open_log(compressed_log) as f:
+        assert f.read() == PAYLOAD
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def test_iter_lines_matches_plain_iteration(compressed_log, threaded):
+    assert list(iter_lines(compressed_log, threaded=threaded)) == PAYLOAD.splitlines(keepends=True)
+
+
+def test_iter_lines_threaded_small_blocks(compressed_log):
+    lines = list(iter_lines_threaded(compressed_log, block_size=7))
+    assert lines == PAYLOAD.splitlines(keepends=True)
+
+
+def test_iter_lines_threaded_stops_producer_on_close(tmp_path):
+    path = tmp_path / "nginx-access-ui.log-20250101.gz"
+    path.write_bytes(gzip.compress(PAYLOAD * 50))
+    before = threading.active_count()
+
+    lines = iter_lines_threaded(str(path), block_size=16)
+    next(lines)
+    lines.close()
+
+    assert threading.active_count() == before
+
+
+def test_iter_lines_threaded_propagates_errors(tmp_path):
+    path = tmp_path / "nginx-access-ui.log-20250101.gz"
+    path.write_bytes(b"definitely not gzip")
+
+    with pytest.raises(gzip.BadGzipFile):
+        list(iter_lines_threaded(str(path)))
+
+
+def test_zst_requires_zstandard(tmp_path, monkeypatch):
+    path = tmp_path / "nginx-access-ui.log-20250101.zst"
+    path.write_bytes(b"")
+    monkeypatch.setitem(__import__("sys").modules, "zstandard", None)
+
+    with pytest.raises(RuntimeError):
+        open_log(str(path))
+
+
+def test_sample_lines_spreads_over_plain_file(tmp_path):
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_bytes(PAYLOAD)
+
+    lines = sample_lines(str(path), 10)
+
+    assert len(lines) == 10
+    assert len(set(lines)) == 10
+    assert all(line in PAYLOAD.splitlines(keepends=True) for line in lines)
+    assert lines[0] == b"line 0 0.000\n"
+    assert lines[-1] != b"line 9 0.009\n"
+
+
+def test_sample_lines_reads_head_of_compressed_file(tmp_path):
+    path = tmp_path / "nginx-access-ui.log-20250101.gz"
+    path.write_bytes(gzip.compress(PAYLOAD))
+
+    assert sample_lines(str(path), 3) == [b"line 0 0.000\n", b"line 1 0.001\n", b"line 2 0.002\n"]
+
+
+def test_sample_lines_short_file_has_no_duplicates(tmp_path):
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_bytes(b"one\ntwo\n")
+
+    assert sample_lines(str(path), 50) == [b"one\n", b"two\n"]
+
+
+def test_iter_lines_mmap_reads_ranges(tmp_path):
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_bytes(PAYLOAD)
+    lines = PAYLOAD.splitlines(keepends=True)
+
+    assert list(iter_lines_mmap(str(path))) == lines
+    start = len(b"".join(lines[:10]))
+    end = len(b"".join(lines[:20]))
+    assert list(iter_lines_mmap(str(path), start, end)) == lines[10:20]
+    assert list(iter_lines_mmap(str(path), end, end)) == []
+
+
+def test_iter_lines_mmap_empty_file(tmp_path):
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_bytes(b"")
+    assert list(iter_lines_mmap(str(path))) == []
+
+
+def test_iter_lines_mmap_falls_back_to_buffered_reads(tmp_path, monkeypatch):
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_bytes(PAYLOAD)
+
+    def no_mmap(*args, **kwargs):
+        raise OSError("mmap is not supported")
+
+    monkeypatch.setattr(mmap, "mmap", no_mmap)
+    assert list(iter_lines_mmap(str(path), 0, 30)) == PAYLOAD.splitlines(keepends=True)[:3]
+
+
+def test_iter_lines_mmap_small_blocks_and_unaligned_end(tmp_path):
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_bytes(PAYLOAD)
+    lines = PAYLOAD.splitlines(keepends=True)
+
+    assert list(iter_lines_mmap(str(path), block_size=7)) == lines
+    assert list(iter_lines_mmap(str(path), 0, len(lines[0]) + 1)) == lines[:2]
@@ -0,0 +1,242 @@
+import gzip
+import json
+import logging
+import pickle
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+import structlog
+
+import log_analyzer.log_analyzer.errors as errors
+import log_analyzer.log_analyzer.log_analyzer as m
+import log_analyzer.log_analyzer.multiday as multiday
+import log_analyzer.log_analyzer.parallel as parallel
+
+from log_analyzer.log_analyzer.errors import (
+    ErrorRateExceeded,
+    ErrorRateParser,
+    ParseErrors,
+    prescan,
+)
+from log_analyzer.log_analyzer.multiday import range_aggregate
+from log_analyzer.log_analyzer.parallel import parallel_aggregate
+
+
+class FakeLog:
+    def __init__(self):
+        self.records = []
+
+    def error(self, event, **fields):
+        self.records.append((event, fields))
+
+
+def test_parse_errors_logs_first_samples_only(monkeypatch):
+    fake = FakeLog()
+    monkeypatch.setattr(errors, "log", fake)
+    now = [0.0]
+    parse_errors = ParseErrors(samples=2, interval=10, clock=lambda: now[0])
+
+    for i in range(5):
+        parse_errors.record("format", f"bad line {i}".encode())
+    parse_errors.record("request", "GET")
+
+    assert parse_errors.counts == {"format": 5, "request": 1}
+    assert [fields["line"] for _, fields in fake.records] == ["bad line 0", "bad line 1"]
+
+    now[0] = 11.0
+    parse_errors.record("format", b"late")
+    assert len(fake.records) == 3
+    assert fake.records[-1][1]["errors"] == {"format": 6, "request": 1}
+
+    parse_errors.record("format", b"too soon")
+    assert len(fake.records) == 3
+
+    parse_errors.summary()
+    assert fake.records[-1][1]["total"] == 8
+
+
+def test_parse_errors_summary_silent_without_errors(monkeypatch):
+    fake = FakeLog()
+    monkeypatch.setattr(errors, "log", fake)
+    ParseErrors().summary()
+    assert fake.records == []
+
+
+def test_parse_line_bytes_counts_failures(monkeypatch):
+    monkeypatch.setattr(errors, "log", FakeLog())
+    monkeypatch.setattr(m, "parse_errors", ParseErrors(samples=0))
+
+    for _ in range(3):
+        assert m.parse_line_bytes(b"garbage\n") is None
+    assert m.parse_errors.counts["format"] == 3
+
+
+def test_configure_structlog_writes_through_queue(tmp_path):
+    try:
+        m.configure_structlog(str(tmp_path), level="info")
+        structlog.get_logger().info("queued", answer=42)
+        m.stop_log_listener()
+
+        record = json.loads((tmp_path / "log.json").read_text(encoding="utf-8"))
+        assert record["event"] == "queued"
+        assert record["answer"] == 42
+    finally:
+        m.stop_log_listener()
+        logging.getLogger().handlers.clear()
+        structlog.reset_defaults()
+
+
+def test_error_rate_parser_aborts_after_min_lines(sample_line, monkeypatch):
+    monkeypatch.setattr(errors, "log", FakeLog())
+    parser = ErrorRateParser(m.parse_line_bytes, threshold=0.5, min_lines=10)
+    good, bad = sample_line.encode(), b"garbage\n"
+
+    for line in [bad] * 9:
+        assert parser(line) is None
+
+    with pytest.raises(ErrorRateExceeded) as e:
+        parser(bad)
+    assert (e.value.lines, e.value.errors) == (10, 10)
+    assert pickle.loads(pickle.dumps(e.value)).errors == 10
+
+    parser = ErrorRateParser(m.parse_line_bytes, threshold=0.5, min_lines=10)
+    for line in [good, bad] * 50:
+        parser(line)
+    assert parser.errors == 50
+
+
+class RecordingPool(ProcessPoolExecutor):
+    cancelled: list[bool] = []
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.cancelled.append(cancel_futures)
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_error_rate_parser_aborts_parallel_run(tmp_path, sample_line, monkeypatch, suffix):
+    monkeypatch.setattr(errors, "log", FakeLog())
+    monkeypatch.setattr(parallel, "ProcessPoolExecutor", RecordingPool)
+    monkeypatch.setattr(RecordingPool, "cancelled", [])
+    path = tmp_path / f"nginx-access-ui.log-20250101{suffix}"
+    payload = sample_line * 100 + "garbage\n" * 2000
+    if suffix:
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        path.write_text(payload, encoding="utf-8")
+    parser = ErrorRateParser(m.parse_line_bytes, threshold=0.2, min_lines=100)
+
+    with pytest.raises(ErrorRateExceeded):
+        parallel_aggregate(str(path), parser, workers=2, chunk_size=1024)
+    assert RecordingPool.cancelled[0] is True
+
+
+def test_error_rate_parser_aborts_range_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(errors, "log", FakeLog())
+    monkeypatch.setattr(multiday, "ProcessPoolExecutor", RecordingPool)
+    monkeypatch.setattr(RecordingPool, "cancelled", [])
+    paths = []
+    for day in range(1, 4):
+        path = tmp_path / f"nginx-access-ui.log-2025010{day}"
+        path.write_text("garbage\n" * 200, encoding="utf-8")
+        paths.append(str(path))
+    parser = ErrorRateParser(m.parse_line_bytes, threshold=0.2, min_lines=100)
+
+    with pytest.raises(ErrorRateExceeded):
+        range_aggregate(paths, str(tmp_path / "cache"), parser, workers=2)
+    assert RecordingPool.cancelled[0] is True
+
+
+def test_prescan_rejects_wrong_format(tmp_path, sample_line, monkeypatch):
+    monkeypatch.setattr(errors, "log", FakeLog())
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_text("garbage\n" * 1000, encoding="utf-8")
+
+    with pytest.raises(ErrorRateExceeded) as e:
+        prescan(str(path), m.parse_line_bytes, 20, threshold=0.2)
+    assert e.value.lines == 20
+
+    path.write_text(sample_line * 1000, encoding="utf-8")
+    prescan(str(path), m.parse_line_bytes, 20, threshold=0.2)
+
+
+def shared_parse_errors(monkeypatch, samples):
+    # Воркеры и родитель работают с глобальным errors.parse_errors, поэтому настраиваем его самого.
+    monkeypatch.setattr(errors.parse_errors, "samples", samples)
+    monkeypatch.setattr(errors.parse_errors, "counts", Counter())
+    monkeypatch.setattr(errors.parse_errors, "_logged", 0)
+    return errors.parse_errors
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_parallel_run_merges_worker_error_counters(tmp_path, sample_line, monkeypatch, suffix):
+    fake = FakeLog()
+    monkeypatch.setattr(errors, "log", fake)
+    collected = shared_parse_errors(monkeypatch, samples=3)
+    path = tmp_path / f"nginx-access-ui.log-20250101{suffix}"
+    payload = (sample_line + "garbage\n") * 500
+    if suffix:
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        path.write_text(payload, encoding="utf-8")
+
+    parallel_aggregate(str(path), m.parse_line_bytes, workers=3, chunk_size=4096)
+
+    assert collected.counts == {"format": 500}
+    samples = [fields["line"] for event, fields in fake.records if "line" in fields]
+    assert samples == ["garbage\n"] * 3
+
+
+def test_range_run_merges_worker_error_counters(tmp_path, sample_line, monkeypatch):
+    monkeypatch.setattr(errors, "log", FakeLog())
+    collected = shared_parse_errors(monkeypatch, samples=0)
+    paths = []
+    for day in range(1, 4):
+        path = tmp_path / f"nginx-access-ui.log-2025010{day}"
+        path.write_text(sample_line + "garbage\n" * day, encoding="utf-8")
+        paths.append(str(path))
+
+    range_aggregate(paths, str(tmp_path / "cache"), m.parse_line_bytes, workers=2)
+
+    assert collected.counts == {"format": 6}
+
+
+def test_prescan_leaves_parse_errors_untouched(tmp_path, monkeypatch):
+    fake = FakeLog()
+    monkeypatch.setattr(errors, "log", fake)
+    collected = shared_parse_errors(monkeypatch, samples=5)
+    collected.record("request", b"GET")
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_text("garbage\n" * 10, encoding="utf-8")
+
+    prescan(str(path), m.parse_line_bytes, 10, threshold=1.0)
+
+    assert collected.counts == {"request": 1}
+    assert len(fake.records) == 1
+
+
+def test_main_prescans_with_bare_parser(tmp_path, sample_line, monkeypatch):
+    monkeypatch.setattr(errors, "log", FakeLog())
+    shared_parse_errors(monkeypatch, samples=0)
+    monkeypatch.setattr(errors.parse_errors, "interval", errors.parse_errors.interval)
+    log_dir, report_dir = tmp_path / "log", tmp_path / "reports"
+    log_dir.mkdir()
+    lines = [sample_line.replace("/api/v2/user", f"/api/{i}") for i in range(100)]
+    (log_dir / "nginx-access-ui.log-20250101").write_text("".join(lines), encoding="utf-8")
+    parsers = []
+    monkeypatch.setattr(m, "prescan", lambda path, parser, *args: parsers.append(parser))
+    monkeypatch.setattr(m, "config_parser", lambda config: True)
+    monkeypatch.setattr(m, "write_report", lambda *args, **kwargs: None)
+    monkeypatch.setitem(m.config, "LOG_DIR", str(log_dir))
+    monkeypatch.setitem(m.config, "REPORT_DIR", str(report_dir))
+    monkeypatch.setitem(m.config, "URL_NORMALIZE", True)
+    monkeypatch.setitem(m.config, "PRESCAN_LINES", 50)
+    monkeypatch.setitem(m.config, "ERROR_THRESHOLD", 0.2)
+
+    m.main()
+
+    assert parsers == [m.parse_line_bytes]
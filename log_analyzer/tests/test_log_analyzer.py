@@ -1,3 +1,4 @@
+import gzip
 import json
 import sys
 
@@ -82,6 +83,59 @@ def test_write_report(tmp_path, template_file):
     assert payload in text
 
 
+def test_write_report_streams_rows(tmp_path, template_file):
+    out = tmp_path / "reports" / "report.html"
+    rows = [{"url": "/x", "count": 1, "time_sum": 0.1}, {"url": "/y", "count": 2, "time_sum": 0.2}]
+
+    m.write_report(str(out), template_file, iter(rows))
+
+    assert out.read_text(encoding="utf-8") == ("<html><body>" + json.dumps(rows) + "</body></html>")
+    assert [p.name for p in out.parent.iterdir()] == ["report.html"]
+
+
+def test_write_report_gzip(tmp_path, template_file):
+    out = tmp_path / "reports" / "report.html"
+
+    m.write_report(str(out), template_file, [], compress=True)
+
+    with gzip.open(str(out) + ".gz", "rt", encoding="utf-8") as f:
+        assert f.read() == "<html><body>[]</body></html>"
+
+
+def test_write_report_keeps_old_report_on_error(tmp_path, template_file):
+    out = tmp_path / "reports" / "report.html"
+    m.write_report(str(out), template_file, "[]")
+
+    def rows():
+        yield {"url": "/x"}
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        m.write_report(str(out), template_file, rows())
+
+    assert out.read_text(encoding="utf-8") == "<html><body>[]</body></html>"
+    assert [p.name for p in out.parent.iterdir()] == ["report.html"]
+
+
+def test_write_report_rejects_template_without_placeholder(tmp_path, template_file):
+    with open(template_file, "w", encoding="utf-8") as f:
+        f.write("<html><body></body></html>")
+    out = tmp_path / "reports" / "report.html"
+
+    with pytest.raises(ValueError, match="table_json"):
+        m.write_report(str(out), template_file, [{"url": "/x"}])
+
+    assert not out.exists()
+
+
+def test_split_template_is_cached(template_file):
+    m._split_template.cache_clear()
+    m.split_template(template_file)
+    m.split_template(template_file)
+
+    assert m._split_template.cache_info().hits == 1
+
+
 def test_config_parser_merges(tmp_path, monkeypatch, logger):
     cfg = tmp_path / "config.json"
     cfg.write_text(
@@ -115,3 +169,40 @@ def test_config_parser_missing_file(monkeypatch, logger):
     monkeypatch.setattr(m, "log", logger, raising=False)
 
     assert m.config_parser(dict(m.config)) is None
+
+
+def test_parse_line_bytes(sample_line, logger, monkeypatch):
+    monkeypatch.setattr(m, "log", logger, raising=False)
+
+    assert m.parse_line_bytes(sample_line.encode()) == (b"/api/v2/user", 0.123)
+
+
+def test_parse_line_bytes_matches_parse_line(
+    sample_line, sample_line_other_url, logger, monkeypatch
+):
+    monkeypatch.setattr(m, "log", logger, raising=False)
+
+    for line in (sample_line, sample_line_other_url, "garbage\n", '1 2 3 [x] "0" 400\n'):
+        parsed = m.parse_line(line)
+        parsed_bytes = m.parse_line_bytes(line.encode())
+        if parsed is None:
+            assert parsed_bytes is None
+        else:
+            assert parsed_bytes == (parsed["url"].encode(), float(parsed["request_time"]))
+
+
+def test_read_lines_bytes_gz_file(gz_log_file, logger, monkeypatch):
+    monkeypatch.setattr(m, "log", logger, raising=False)
+    lines = list(m.read_lines_bytes(gz_log_file))
+    assert lines == [lines[0]]
+    assert lines[0].endswith(b"0.123\n")
+
+
+def test_aggregate_lines_decodes_report_urls(logger, monkeypatch, sample_line):
+    monkeypatch.setattr(m, "log", logger, raising=False)
+    line = sample_line.replace("/api/v2/user", "/api/v2/пользователь").encode()
+
+    report = m.aggregate_lines([line, line], m.parse_line_bytes).report(10)
+
+    assert report[0]["url"] == "/api/v2/пользователь"
+    assert report[0]["count"] == 2
@@ -0,0 +1,102 @@
+import gzip
+import os
+
+import pytest
+
+import log_analyzer.log_analyzer.log_analyzer as m
+
+from log_analyzer.log_analyzer.aggregate import aggregate_lines
+from log_analyzer.log_analyzer.multiday import cache_file_for, range_aggregate
+from log_analyzer.log_analyzer.normalize import NormalizingParser, UrlNormalizer
+
+
+@pytest.fixture
+def week_logs(tmp_path, sample_line, sample_line_other_url):
+    log_dir = tmp_path / "log"
+    log_dir.mkdir()
+    lines = {}
+    for day in range(1, 8):
+        name = f"nginx-access-ui.log-2025010{day}" + (".gz" if day % 2 else "")
+        payload = (sample_line * day + sample_line_other_url).encode()
+        lines[name] = payload
+        if name.endswith(".gz"):
+            with gzip.open(log_dir / name, "wb") as f:
+                f.write(payload)
+        else:
+            (log_dir / name).write_bytes(payload)
+    (log_dir / "some-other-file.txt").write_text("x", encoding="utf-8")
+    return log_dir, lines
+
+
+def test_find_logs_in_range(week_logs):
+    log_dir, _ = week_logs
+
+    files = m.find_logs_in_range(str(log_dir) + "/", "20250102", "20250104")
+
+    assert [os.path.basename(f) for f in files] == [
+        "nginx-access-ui.log-20250102",
+        "nginx-access-ui.log-20250103.gz",
+        "nginx-access-ui.log-20250104",
+    ]
+
+
+def test_date_arg_rejects_garbage():
+    with pytest.raises(ValueError):
+        m.date_arg("2025-01-01")
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_range_aggregate_merges_and_caches(tmp_path, week_logs, workers):
+    log_dir, lines = week_logs
+    cache_dir = str(tmp_path / "cache")
+    paths = m.find_logs_in_range(str(log_dir) + "/", "20250101", "20250107")
+
+    aggregate = range_aggregate(paths, cache_dir, m.parse_line_bytes, 0, workers=workers)
+
+    expected = aggregate_lines(
+        b"".join(lines.values()).splitlines(keepends=True), m.parse_line_bytes, 0
+    )
+    assert aggregate.report(10) == expected.report(10)
+    assert all(os.path.exists(cache_file_for(cache_dir, path)) for path in paths)
+
+
+def test_range_aggregate_parses_only_new_days(tmp_path, week_logs):
+    log_dir, _ = week_logs
+    cache_dir = str(tmp_path / "cache")
+    paths = m.find_logs_in_range(str(log_dir) + "/", "20250101", "20250107")
+    range_aggregate(paths[:-1], cache_dir, m.parse_line_bytes)
+
+    parsed = []
+
+    def parser(line):
+        parsed.append(line)
+        return m.parse_line_bytes(line)
+
+    aggregate = range_aggregate(paths, cache_dir, parser)
+
+    assert len(parsed) == 8
+    assert sum(stats.count for stats in aggregate.urls.values()) == sum(range(1, 8)) + 7
+
+
+class CountingParser:
+    def __init__(self, parser):
+        self.parser = parser
+        self.lines = 0
+
+    def __call__(self, line):
+        self.lines += 1
+        return self.parser(line)
+
+
+def test_range_aggregate_ignores_cache_of_other_url_settings(tmp_path, week_logs):
+    log_dir, _ = week_logs
+    cache_dir = str(tmp_path / "cache")
+    paths = m.find_logs_in_range(str(log_dir) + "/", "20250101", "20250107")
+    range_aggregate(paths, cache_dir, m.parse_line_bytes)
+
+    parser = CountingParser(NormalizingParser(m.parse_line_bytes, UrlNormalizer()))
+    range_aggregate(paths, cache_dir, parser)
+    range_aggregate(paths, cache_dir, parser)
+
+    assert parser.lines == sum(range(1, 8)) + 7
+    assert len(os.listdir(cache_dir)) == 2 * len(paths)
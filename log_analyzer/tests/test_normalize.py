@@ -0,0 +1,93 @@
+import pickle
+
+import pytest
+
+import log_analyzer.log_analyzer.log_analyzer as m
+
+from log_analyzer.log_analyzer.aggregate import OTHER_URL, LogAggregate, aggregate_lines
+from log_analyzer.log_analyzer.normalize import NormalizingParser, UrlNormalizer
+from log_analyzer.log_analyzer.parallel import parallel_aggregate
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        (b"/api/v2/user/123?x=1&y=2", b"/api/v2/user/{id}"),
+        (b"/api/v2/user/123/orders/45", b"/api/v2/user/{id}/orders/{id}"),
+        (b"/api/v2/banner/v2", b"/api/v2/banner/v2"),
+        (b"/export/7c9e6679-7425-40de-944b-e07fc1f90ae7/", b"/export/{uuid}/"),
+    ],
+)
+def test_default_normalization(url, expected):
+    assert UrlNormalizer()(url) == expected
+
+
+def test_user_rules_and_cache():
+    normalizer = UrlNormalizer(rules=[(r"^/slot/[a-z]+", "/slot/{name}")])
+
+    assert normalizer(b"/slot/alpha?x=1") == b"/slot/{name}"
+    assert normalizer(b"/slot/alpha?x=1") == b"/slot/{name}"
+    assert normalizer._cached.cache_info().hits == 1
+
+
+def test_max_urls_caps_after_merge(tmp_path, sample_line):
+    lines = [sample_line.replace("/api/v2/user", url) for url in ("/a", "/b", "/a")]
+    path = tmp_path / "nginx-access-ui.log-20250101"
+    path.write_text("".join(line * 2000 for line in lines), encoding="utf-8")
+    settings = dict(m.config, URL_NORMALIZE=True, MAX_URLS=1)
+    parser = m.make_parser(settings)
+
+    single = aggregate_lines(m.read_lines_bytes(str(path)), parser, median_error=0)
+    parallel = parallel_aggregate(str(path), parser, workers=3, median_error=0)
+    single.limit(settings["MAX_URLS"])
+    parallel.limit(settings["MAX_URLS"])
+
+    assert parallel.report(10) == single.report(10)
+    assert single.urls[b"/a"].count == 4000
+    assert single.urls[OTHER_URL].count == 2000
+
+
+def test_normalizer_is_picklable():
+    normalizer = UrlNormalizer(rules=[("x", "y")])
+    normalizer(b"/x/1")
+
+    restored = pickle.loads(pickle.dumps(NormalizingParser(m.parse_line_bytes, normalizer)))
+
+    assert restored.normalizer(b"/x/2") == b"/y/{id}"
+
+
+def test_normalizing_parser(sample_line):
+    parser = NormalizingParser(m.parse_line_bytes, UrlNormalizer())
+    lines = [
+        sample_line.replace("/api/v2/user", f"/api/v2/user/{i}?q={i}").encode() for i in range(5)
+    ]
+
+    aggregate = aggregate_lines(lines, parser)
+
+    assert list(aggregate.urls) == [b"/api/v2/user/{id}"]
+    assert parser(b"garbage") is None
+
+
+def test_aggregate_limit_keeps_heaviest_urls():
+    aggregate = LogAggregate(median_error=0)
+    for i in range(10):
+        aggregate.add(f"/u/{i}".encode(), float(i))
+
+    aggregate.limit(3)
+
+    assert set(aggregate.urls) == {b"/u/9", b"/u/8", b"/u/7", OTHER_URL}
+    assert aggregate.urls[OTHER_URL].count == 7
+    assert aggregate.urls[OTHER_URL].time_sum == sum(range(7))
+
+
+def test_make_parser_from_config():
+    settings = dict(m.config)
+    assert m.make_parser(settings) is m.parse_line_bytes
+
+    settings["MAX_URLS"] = 10
+    assert m.make_parser(settings) is m.parse_line_bytes
+
+    settings.update({"URL_NORMALIZE": True, "URL_RULES": [["^/x", "/y"]]})
+    parser = m.make_parser(settings)
+    assert isinstance(parser, NormalizingParser)
+    assert parser.normalizer(b"/x/1?q=1") == b"/y/{id}"
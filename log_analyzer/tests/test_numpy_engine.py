@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+import log_analyzer.log_analyzer.log_analyzer as m
+
+from log_analyzer.log_analyzer.aggregate import OTHER_URL, LogAggregate, aggregate_lines
+
+pytest.importorskip("numpy")
+
+from log_analyzer.log_analyzer.numpy_engine import NumpyAggregate, numpy_aggregate_lines  # noqa: E402
+
+
+@pytest.fixture
+def random_lines(sample_line):
+    rnd = random.Random(3)
+    return [
+        sample_line.replace("/api/v2/user", f"/api/{rnd.randrange(50)}")
+        .replace("0.123", f"{rnd.lognormvariate(-1, 1):.3f}")
+        .encode()
+        for _ in range(3000)
+    ]
+
+
+def test_numpy_engine_matches_exact_python_engine(random_lines):
+    expected = aggregate_lines(random_lines, m.parse_line_bytes, median_error=0).report(20)
+
+    report = numpy_aggregate_lines(random_lines, m.parse_line_bytes, batch_size=256).report(20)
+
+    assert report == expected
+
+
+def test_numpy_engine_merge(random_lines):
+    left = numpy_aggregate_lines(random_lines[:1000], m.parse_line_bytes, batch_size=100)
+    right = numpy_aggregate_lines(random_lines[1000:], m.parse_line_bytes, batch_size=100)
+    left.merge(right)
+
+    expected = numpy_aggregate_lines(random_lines, m.parse_line_bytes).report(50)
+    assert sorted(left.report(50), key=lambda r: r["url"]) == sorted(
+        expected, key=lambda r: r["url"]
+    )
+
+
+def test_numpy_engine_limit_matches_python_engine():
+    python_aggregate = LogAggregate(median_error=0)
+    numpy_aggregate = NumpyAggregate()
+    for i in range(10):
+        for aggregate in (python_aggregate, numpy_aggregate):
+            aggregate.add(f"/u/{i}".encode(), float(i))
+            aggregate.add(OTHER_URL, 0.5)
+
+    python_aggregate.limit(3)
+    numpy_aggregate.limit(3)
+
+    assert numpy_aggregate.report(10) == python_aggregate.report(10)
+
+
+def test_numpy_engine_empty():
+    assert NumpyAggregate().report(10) == []
@@ -0,0 +1,58 @@
+import gzip
+
+import pytest
+
+import log_analyzer.log_analyzer.log_analyzer as m
+
+from log_analyzer.log_analyzer.parallel import parallel_aggregate, split_ranges
+
+
+@pytest.fixture
+def big_log_lines(sample_line, sample_line_other_url):
+    lines = []
+    for i in range(300):
+        line = sample_line if i % 3 else sample_line_other_url
+        lines.append(line.replace("/api/v2/user", f"/api/v2/user/{i % 7}"))
+    return lines
+
+
+def test_split_ranges_align_to_lines(tmp_path, big_log_lines):
+    p = tmp_path / "nginx-access-ui.log-20250101"
+    p.write_text("".join(big_log_lines), encoding="utf-8")
+    data = p.read_bytes()
+
+    ranges = split_ranges(str(p), 4)
+
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:], strict=False):
+        assert end == start
+        assert data[start - 1 : start] == b"\n"
+
+
+def test_split_ranges_more_workers_than_lines(plain_log_file):
+    ranges = split_ranges(plain_log_file, 16)
+    assert len(ranges) == 2
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_parallel_aggregate_matches_report_maker(
+    tmp_path, big_log_lines, suffix, logger, monkeypatch
+):
+    monkeypatch.setattr(m, "log", logger, raising=False)
+    p = tmp_path / f"nginx-access-ui.log-20250101{suffix}"
+    payload = "".join(big_log_lines).encode("utf-8")
+    if suffix:
+        with gzip.open(p, "wb") as f:
+            f.write(payload)
+    else:
+        p.write_bytes(payload)
+
+    expected = m.report_maker(big_log_lines, m.parse_line, report_size=100, median_error=0)
+    aggregate = parallel_aggregate(
+        str(p), m.parse_line_bytes, workers=3, median_error=0, chunk_size=512
+    )
+
+    assert sorted(aggregate.report(100), key=lambda r: r["url"]) == sorted(
+        expected, key=lambda r: r["url"]
+    )
@@ -0,0 +1,109 @@
+import gzip
+import json
+
+import pytest
+
+import log_analyzer.log_analyzer.log_analyzer as m
+
+from log_analyzer.log_analyzer.aggregate import LogAggregate, aggregate_lines
+from log_analyzer.log_analyzer.normalize import NormalizingParser, UrlNormalizer
+from log_analyzer.log_analyzer.state import incremental_aggregate, load_checkpoint
+
+
+@pytest.fixture
+def raw_lines(sample_line, sample_line_other_url):
+    return [
+        line.replace("/api/v2/user", f"/api/v2/user/{i % 3}").encode()
+        for i, line in enumerate([sample_line, sample_line_other_url] * 5)
+    ]
+
+
+@pytest.mark.parametrize("median_error", [0, 0.01])
+def test_aggregate_round_trip(raw_lines, median_error):
+    aggregate = aggregate_lines(raw_lines, m.parse_line_bytes, median_error)
+
+    restored = LogAggregate.from_dict(json.loads(json.dumps(aggregate.to_dict())))
+
+    assert set(restored.urls) == set(aggregate.urls)
+    assert restored.report(10) == aggregate.report(10)
+
+
+def test_incremental_resumes_from_offset(tmp_path, raw_lines):
+    log_file = tmp_path / "nginx-access-ui.log-20250101"
+    state_file = str(tmp_path / "state" / "state.json")
+    log_file.write_bytes(b"".join(raw_lines[:4]) + raw_lines[4][:20])
+
+    first = incremental_aggregate(str(log_file), state_file, m.parse_line_bytes, 0)
+    checkpoint = load_checkpoint(state_file)
+    assert checkpoint is not None
+    assert checkpoint.offset == len(b"".join(raw_lines[:4]))
+    assert sum(stats.count for stats in first.urls.values()) == 4
+
+    with open(log_file, "ab") as f:
+        f.write(raw_lines[4][20:] + b"".join(raw_lines[5:]))
+
+    resumed = incremental_aggregate(str(log_file), state_file, m.parse_line_bytes, 0)
+    expected = aggregate_lines(raw_lines, m.parse_line_bytes, 0)
+    assert resumed.report(10) == expected.report(10)
+
+
+def test_incremental_restarts_on_rotation(tmp_path, raw_lines):
+    log_file = tmp_path / "nginx-access-ui.log-20250101"
+    state_file = str(tmp_path / "state.json")
+    log_file.write_bytes(b"".join(raw_lines))
+    incremental_aggregate(str(log_file), state_file, m.parse_line_bytes, 0)
+
+    log_file.unlink()
+    rotated = tmp_path / "rotated"
+    rotated.write_bytes(b"".join(raw_lines[:2]))
+    rotated.rename(log_file)
+
+    aggregate = incremental_aggregate(str(log_file), state_file, m.parse_line_bytes, 0)
+    assert sum(stats.count for stats in aggregate.urls.values()) == 2
+
+
+def test_incremental_restarts_when_rewritten_in_place(tmp_path, raw_lines):
+    log_file = tmp_path / "nginx-access-ui.log-20250101"
+    state_file = str(tmp_path / "state.json")
+    log_file.write_bytes(b"".join(raw_lines[:4]))
+    incremental_aggregate(str(log_file), state_file, m.parse_line_bytes, 0)
+
+    rewritten = [line.replace(b"/api/v2/user", b"/api/v3/user") for line in raw_lines]
+    with open(log_file, "r+b") as f:
+        f.truncate(0)
+        f.write(b"".join(rewritten))
+
+    aggregate = incremental_aggregate(str(log_file), state_file, m.parse_line_bytes, 0)
+    assert aggregate.report(10) == aggregate_lines(rewritten, m.parse_line_bytes, 0).report(10)
+
+
+def test_incremental_skips_unchanged_gz(tmp_path, raw_lines, monkeypatch):
+    log_file = tmp_path / "nginx-access-ui.log-20250101.gz"
+    state_file = str(tmp_path / "state.json")
+    with gzip.open(log_file, "wb") as f:
+        f.write(b"".join(raw_lines))
+
+    first = incremental_aggregate(str(log_file), state_file, m.parse_line_bytes)
+
+    def fail(line):
+        raise AssertionError("log must not be parsed again")
+
+    second = incremental_aggregate(str(log_file), state_file, fail)
+    assert second.report(10) == first.report(10)
+
+
+def test_incremental_restarts_when_url_normalization_changes(tmp_path, raw_lines):
+    log_file = tmp_path / "nginx-access-ui.log-20250101"
+    state_file = str(tmp_path / "state.json")
+    log_file.write_bytes(b"".join(raw_lines[:4]))
+    incremental_aggregate(str(log_file), state_file, m.parse_line_bytes, 0)
+
+    with open(log_file, "ab") as f:
+        f.write(b"".join(raw_lines[4:]))
+    parser = NormalizingParser(m.parse_line_bytes, UrlNormalizer())
+    aggregate = incremental_aggregate(str(log_file), state_file, parser, 0)
+
+    assert aggregate.report(10) == aggregate_lines(raw_lines, parser, 0).report(10)
+    checkpoint = load_checkpoint(state_file)
+    assert checkpoint is not None
+    assert checkpoint.url_fingerprint == UrlNormalizer().fingerprint()
@@ -0,0 +1,181 @@
+"""Бенчмарк memc_load_hw против локальных fake memcached.
+
+Пример:
+    python bench_memc_load.py --lines 200000 --parsers 0 2 4
+"""
+
+import argparse
+import gzip
+import logging
+import os
+import random
+import tempfile
+import time
+
+import memc_load_hw as ml
+
+from fake_memcached import AsyncFakeMemcached, FakeMemcached
+
+DEV_TYPES = ("idfa", "gaid", "adid", "dvid")
+SERVERS = {"threads": FakeMemcached, "asyncio": AsyncFakeMemcached}
+
+
+def generate_file(path, lines, seed=42):
+    rnd = random.Random(seed)
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as fd:
+        for _ in range(lines):
+            apps = ",".join(str(rnd.randrange(10000)) for _ in range(rnd.randrange(1, 30)))
+            dev_type, dev_id = rnd.choice(DEV_TYPES), rnd.getrandbits(128)
+            lat, lon = rnd.uniform(-90, 90), rnd.uniform(-180, 180)
+            fd.write(f"{dev_type}\t{dev_id:032x}\t{lat:.6f}\t{lon:.6f}\t{apps}\n")
+
+
+def run(path, servers, args, **options):
+    for server in servers:
+        with server.lock:
+            server.storage.clear()
+    nodes = len(servers) // len(DEV_TYPES)
+    device_memc = {
+        dev_type: [server.address for server in servers[i * nodes : (i + 1) * nodes]]
+        for i, dev_type in enumerate(DEV_TYPES)
+    }
+    started = time.perf_counter()
+    processed, errors = ml.process_file(
+        path,
+        device_memc,
+        dry_run=False,
+        workers=args.workers,
+        batch_size=args.batch,
+        queue_size=args.queue_size,
+        socket_timeout=1.0,
+        retry=1,
+        retry_backoff=0.05,
+        flush_interval=args.flush_ms / 1000.0,
+        inflight=args.inflight,
+        **options,
+    )
+    elapsed = time.perf_counter() - started
+    stored = sum(len(server.storage) for server in servers)
+    return elapsed, processed, errors, stored
+
+
+def bench_encoder(count, seed=42):
+    rnd = random.Random(seed)
+    records = [
+        (
+            [rnd.randrange(10000) for _ in range(rnd.randrange(1, 30))],
+            rnd.uniform(-90, 90),
+            rnd.uniform(-180, 180),
+        )
+        for _ in range(count)
+    ]
+
+    def protobuf(apps, lat, lon):
+        ua = ml.appsinstalled_pb2.UserApps()
+        ua.lat = lat
+        ua.lon = lon
+        ua.apps.extend(apps)
+        return ua.SerializeToString()
+
+    for name, encode in (
+        ("SerializeToString", protobuf),
+        ("encode_user_apps", ml.encode_user_apps),
+    ):
+        started = time.perf_counter()
+        for record in records:
+            encode(*record)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>30}: {elapsed:.2f}s, {count / elapsed:8.0f} records/s")
+
+
+def report(name, lines, result):
+    elapsed, processed, errors, stored = result
+    print(
+        f"{name:>30}: {elapsed:.2f}s, {lines / elapsed:8.0f} lines/s "
+        f"(processed={processed} errors={errors} stored={stored})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк загрузчика memc_load_hw")
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--parsers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument(
+        "--clients", nargs="+", choices=["pool", "memcache"], default=["pool", "memcache"]
+    )
+    parser.add_argument(
+        "--nodes",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="Сколько узлов memcached на каждый dev_type (ключи раскладываются по кольцу)",
+    )
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--queue-size", type=int, default=50000)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Задержка ответа fake memcached на пачку команд (сек)",
+    )
+    parser.add_argument(
+        "--latency-budget-ms",
+        type=float,
+        nargs="+",
+        default=[0.0],
+        help="Бюджеты задержки set_multi для подстройки пачки, 0 — фиксированный --batch",
+    )
+    parser.add_argument("--flush-ms", type=float, default=100.0)
+    parser.add_argument("--engines", nargs="+", choices=["threads", "asyncio"], default=["threads"])
+    parser.add_argument(
+        "--inflight",
+        type=int,
+        default=ml.ASYNC_INFLIGHT,
+        help="Пачек в полёте на адрес для --engines asyncio",
+    )
+    parser.add_argument(
+        "--server",
+        choices=sorted(SERVERS),
+        default="threads",
+        help="Какой fake memcached поднимать: поток на соединение или asyncio",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(f"cpu count: {os.cpu_count()}")
+    bench_encoder(min(args.lines, 50000))
+    server_cls = SERVERS[args.server]
+    servers = [
+        server_cls(latency=args.latency).start() for _ in range(len(DEV_TYPES) * max(args.nodes))
+    ]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "20170929000000.tsv.gz")
+            generate_file(path, args.lines)
+            for nodes in args.nodes:
+                for engine in args.engines:
+                    # Движок asyncio пишет своими соединениями, --clients к нему не относится.
+                    for client in args.clients if engine == "threads" else args.clients[:1]:
+                        for parsers in args.parsers:
+                            for budget in args.latency_budget_ms:
+                                result = run(
+                                    path,
+                                    servers[: len(DEV_TYPES) * nodes],
+                                    args,
+                                    parsers=parsers,
+                                    client=client,
+                                    latency_budget=budget / 1000.0,
+                                    engine=engine,
+                                )
+                                name = f"nodes={nodes} engine={engine} parsers={parsers} budget={budget}ms"
+                                if engine == "threads":
+                                    name += f" client={client}"
+                                report(name, args.lines, result)
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Memcached на Python для тестов и бенчмарков memc_load_hw.
+
+Понимает текстовые команды set/add/replace (с noreply), get/gets, delete, version,
+flush_all и quit. Команды из одного recv() разбираются пачкой и ответы уходят одним
+sendall(), как у настоящего memcached при конвейерной отправке.
+
+FakeMemcached обслуживает каждое соединение своим потоком, AsyncFakeMemcached — корутиной
+в одном цикле событий (в фоновом потоке); разбор команд у них общий.
+"""
+
+import asyncio
+import socket
+import socketserver
+import threading
+import time
+
+
+def process_commands(buffer, storage, lock, responses):
+    """Разбирает все полные команды из buffer (bytearray), дописывает ответы в responses.
+
+    Возвращает True, если клиент прислал quit.
+    """
+    while True:
+        end = buffer.find(b"\r\n")
+        if end < 0:
+            return False
+        parts = bytes(buffer[:end]).split()
+        if not parts:
+            del buffer[: end + 2]
+            continue
+        command = parts[0]
+
+        if command in (b"set", b"add", b"replace"):
+            size = int(parts[4])
+            if len(buffer) < end + 2 + size + 2:
+                return False
+            data = bytes(buffer[end + 2 : end + 2 + size])
+            del buffer[: end + 2 + size + 2]
+            key, flags = parts[1], int(parts[2])
+            with lock:
+                if (
+                    command == b"add"
+                    and key in storage
+                    or command == b"replace"
+                    and key not in storage
+                ):
+                    reply = b"NOT_STORED\r\n"
+                else:
+                    storage[key] = (flags, data)
+                    reply = b"STORED\r\n"
+            if parts[-1] != b"noreply":
+                responses.append(reply)
+            continue
+
+        del buffer[: end + 2]
+        if command in (b"get", b"gets"):
+            with lock:
+                for key in parts[1:]:
+                    if key in storage:
+                        flags, data = storage[key]
+                        responses.append(
+                            b"VALUE %s %d %d\r\n%s\r\n" % (key, flags, len(data), data)
+                        )
+            responses.append(b"END\r\n")
+        elif command == b"delete":
+            with lock:
+                reply = (
+                    b"DELETED\r\n" if storage.pop(parts[1], None) is not None else b"NOT_FOUND\r\n"
+                )
+            if parts[-1] != b"noreply":
+                responses.append(reply)
+        elif command == b"version":
+            responses.append(b"VERSION 1.6.0-fake\r\n")
+        elif command == b"flush_all":
+            with lock:
+                storage.clear()
+            responses.append(b"OK\r\n")
+        elif command == b"quit":
+            return True
+        else:
+            responses.append(b"ERROR\r\n")
+
+
+class MemcacheHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        with self.server.lock:
+            self.server.connections.add(self.request)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.connections.discard(self.request)
+
+    def handle(self):
+        buffer = bytearray()
+        while True:
+            try:
+                data = self.request.recv(256 * 1024)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            responses = []
+            quit = process_commands(buffer, self.server.storage, self.server.lock, responses)
+            if responses:
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                self.request.sendall(b"".join(responses))
+            if quit:
+                return
+
+
+class FakeMemcached(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), MemcacheHandler)
+        self.storage = {}
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.connections = set()
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Останавливает сервер и рвёт открытые соединения, как при рестарте memcached."""
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            connections = list(self.connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class AsyncFakeMemcached:
+    """Тот же протокол на asyncio.start_server; интерфейс как у FakeMemcached."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.storage = {}
+        self.lock = threading.Lock()
+        self.server_address = None
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._writers = set()
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(256 * 1024)
+                if not data:
+                    return
+                buffer += data
+                responses = []
+                quit = process_commands(buffer, self.storage, self.lock, responses)
+                if responses:
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    writer.write(b"".join(responses))
+                    await writer.drain()
+                if quit:
+                    return
+        except OSError:
+            return
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, reuse_address=True)
+            )
+            self.server_address = self._server.sockets[0].getsockname()
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        """Останавливает сервер и рвёт открытые соединения."""
+
+        async def shutdown():
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import sys
+
+    server = FakeMemcached(port=int(sys.argv[1]) if len(sys.argv) > 1 else 11211)
+    print(f"fake memcached on {server.address}")
+    server.serve_forever()
@@ -1,24 +1,45 @@
+import asyncio
+import bisect
 import collections
-import gzip
 import glob
+import gzip
+import hashlib
+import itertools
+import json
 import logging
 import os
-os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "python")
+import queue
+import socket
+import struct
 import sys
 import threading
 import time
-from optparse import OptionParser
-
-import queue
-
-import appsinstalled_pb2
-
-import memcache
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from optparse import OptionParser
 
+# Питоновая реализация protobuf выбирается до импорта appsinstalled_pb2.
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "python")
 
+import appsinstalled_pb2  # noqa: E402
+import memcache  # noqa: E402
 
 NORMAL_ERR_RATE = 0.01
+CHUNK_LINES = 10000
+HEALTH_CHECK_INTERVAL = 30.0
+RECONNECT_BACKOFF = 0.1
+RECONNECT_BACKOFF_MAX = 5.0
+MAX_KEY_LENGTH = 250
+RING_REPLICAS = 160
+METRICS_INTERVAL = 10.0
+FLUSH_INTERVAL = 0.1
+BATCH_MAX = 4096
+BACKPRESSURE_WAIT = 1.0
+ASYNC_INFLIGHT = 8
+CHECKPOINT_INTERVAL = 10.0
+DRAIN_POLL = 0.5
+# Верхние границы корзин гистограммы задержек set_multi (мс), последняя корзина — всё, что дольше.
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
 
 
 AppsInstalled = collections.namedtuple("AppsInstalled", ["dev_type", "dev_id", "lat", "lon", "apps"])
@@ -36,7 +57,7 @@ def iter_files_chronological(pattern):
 
 
 def parse_appsinstalled(line):
-    line_parts = line.strip().split("\t")
+    line_parts = line.strip(" \r\n").split("\t")
     if len(line_parts) < 5:
         return None
     dev_type, dev_id, lat, lon, raw_apps = line_parts
@@ -45,50 +66,692 @@ def parse_appsinstalled(line):
     try:
         apps = [int(a.strip()) for a in raw_apps.split(",")]
     except ValueError:
-        apps = [int(a.strip()) for a in raw_apps.split(",") if a.isidigit()]
-        logging.info("Not all user apps are digits: `%s`" % line)
+        apps = [int(a.strip()) for a in raw_apps.split(",") if a.strip().isdigit()]
+        logging.info("Not all user apps are digits: `%s`", line)
     try:
         lat, lon = float(lat), float(lon)
     except ValueError:
-        logging.info("Invalid geo coords: `%s`" % line)
+        logging.info("Invalid geo coords: `%s`", line)
+        return None
     return AppsInstalled(dev_type, dev_id, lat, lon, apps)
 
 
+# UserApps (proto2): 1 repeated uint32 apps (не packed), 2 double lat, 3 double lon.
+APPS_TAG = b"\x08"
+GEO_FIELDS = struct.Struct("<BdBd")
+LAT_TAG = 0x11
+LON_TAG = 0x19
+UINT32_MAX = (1 << 32) - 1
+
+
+def encode_varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_app(app):
+    if not 0 <= app <= UINT32_MAX:
+        raise ValueError(f"app id out of uint32 range: {app}")
+    return APPS_TAG + encode_varint(app)
+
+
+# Тег + varint для id приложений, которые помещаются в два байта varint.
+APP_FIELDS = [encode_app(app) for app in range(1 << 14)]
+
+
+def encode_user_apps(apps, lat, lon):
+    """Байт в байт то же, что appsinstalled_pb2.UserApps(...).SerializeToString()."""
+    buf = bytearray(b"".join([
+        APP_FIELDS[app] if 0 <= app < len(APP_FIELDS) else encode_app(app) for app in apps
+    ]))
+    pos = len(buf)
+    buf.extend(bytes(GEO_FIELDS.size))
+    GEO_FIELDS.pack_into(buf, pos, LAT_TAG, lat, LON_TAG, lon)
+    return bytes(buf)
+
+
 def make_key_and_value(appsinstalled):
-    ua = appsinstalled_pb2.UserApps()
-    ua.lat = appsinstalled.lat
-    ua.lon = appsinstalled.lon
-    ua.apps.extend(appsinstalled.apps)
+    key = f"{appsinstalled.dev_type}:{appsinstalled.dev_id}"
+    packed = encode_user_apps(appsinstalled.apps, appsinstalled.lat, appsinstalled.lon)
+    return key, packed
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8"), usedforsecurity=False).digest()[:8], "big")
+
+
+class HashRing:
+    """Консистентное хеширование ключей по узлам memcached.
+
+    Каждый узел занимает replicas точек на кольце, ключ уходит на первую точку по часовой
+    стрелке. При добавлении узла переезжает примерно 1/N ключей. Хеш — md5, поэтому
+    раскладка одинакова во всех процессах и между запусками.
+    """
+
+    def __init__(self, nodes, replicas=RING_REPLICAS):
+        self.nodes = sorted(set(nodes))
+        points = sorted(
+            (ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, key):
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        index = bisect.bisect(self._hashes, ring_hash(key))
+        return self._nodes[index % len(self._nodes)]
+
+
+def split_addrs(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [addr.strip() for addr in value if addr.strip()]
+
+
+def make_rings(device_memc):
+    """{dev_type: "addr" | "addr1,addr2" | [addr, ...]} -> {dev_type: HashRing}."""
+    rings = {}
+    for dev_type, value in device_memc.items():
+        addrs = split_addrs(value)
+        if addrs:
+            rings[dev_type] = HashRing(addrs)
+    return rings
+
+
+def parse_lines(lines, rings, dry_run=False):
+    """Разбирает пачку строк: {addr: [(key, packed), ...]}, число ошибок разбора и неизвестных dev_type.
+
+    rings — {dev_type: HashRing}, узел для ключа выбирается по кольцу.
+    """
+    batches = collections.defaultdict(list)
+    errors_parse = 0
+    errors_unknown = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+
+        appsinstalled = parse_appsinstalled(line)
+        if not appsinstalled:
+            errors_parse += 1
+            continue
+
+        ring = rings.get(appsinstalled.dev_type)
+        if ring is None:
+            errors_unknown += 1
+            logging.error("Unknown device type: %s", appsinstalled.dev_type)
+            continue
+
+        key, packed = make_key_and_value(appsinstalled)
+        memc_addr = ring.get_node(key)
+
+        if dry_run:
+            logging.debug("%s - %s -> %s", memc_addr, key, appsinstalled)
+
+        batches[memc_addr].append((key, packed))
+    return dict(batches), errors_parse, errors_unknown
+
+
+def iter_chunks(fn, chunk_lines=CHUNK_LINES, start_line=0):
+    """Отдаёт (номер строки после пачки, прочитано сжатых байт, пачка строк).
 
-    key = "%s:%s" % (appsinstalled.dev_type, appsinstalled.dev_id)
-    packed = ua.SerializeToString()
-    return key, packed, ua
+    Первые start_line строк пропускаются: их всё равно приходится распаковать
+    (gzip не умеет начинать с середины потока), но не разбирать и не писать.
+    """
+    chunk = []
+    with gzip.open(fn, "rb") as fd:
+        collections.deque(itertools.islice(fd, start_line), maxlen=0)
+        line_no = start_line
+        for line in fd:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                line_no += len(chunk)
+                yield line_no, fd.fileobj.tell(), chunk
+                chunk = []
+        if chunk:
+            yield line_no + len(chunk), fd.fileobj.tell(), chunk
+
+
+def start_parser_pool(parsers):
+    # Процессы форкаются сразу, пока в родителе ещё нет потоков-писателей.
+    pool = ProcessPoolExecutor(max_workers=parsers)
+    pool.submit(int).result()
+    return pool
+
+
+def iter_parsed_chunks(fn, rings, dry_run, chunk_lines, pool=None, parsers=0, start_line=0):
+    """Отдаёт (номер строки, сжатое смещение, результат parse_lines) по пачкам, по порядку."""
+    if pool is None:
+        for line_no, offset, chunk in iter_chunks(fn, chunk_lines, start_line):
+            yield line_no, offset, parse_lines(chunk, rings, dry_run)
+        return
+
+    pending = collections.deque()
+    for line_no, offset, chunk in iter_chunks(fn, chunk_lines, start_line):
+        if len(pending) >= 2 * max(1, parsers):
+            done_line, done_offset, future = pending.popleft()
+            yield done_line, done_offset, future.result()
+        pending.append((line_no, offset, pool.submit(parse_lines, chunk, rings, dry_run)))
+    while pending:
+        done_line, done_offset, future = pending.popleft()
+        yield done_line, done_offset, future.result()
+
+
+class LoadCheckpoint:
+    """Докуда файл подтверждён всеми писателями; хранится рядом с файлом в <файл>.checkpoint.
+
+    Пачка строк регистрируется до того, как её задачи попадут в очереди: задачи
+    помечаются номером пачки, писатели подтверждают их после set_multi. Граница
+    сдвигается только через пачки, все задачи которых записались без ошибок, так что
+    после падения повторно грузится лишь хвост файла (set идемпотентен).
+    """
+
+    def __init__(self, fn, interval=CHECKPOINT_INTERVAL):
+        self.fn = fn
+        self.path = fn + ".checkpoint"
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = collections.OrderedDict()
+        self.failed = set()
+        self.line = 0
+        self.offset = 0
+        self.saved_at = time.monotonic()
+        self._load()
+
+    def _identity(self):
+        st = os.stat(self.fn)
+        return {"file": os.path.basename(self.fn), "size": st.st_size, "mtime": st.st_mtime}
+
+    def _load(self):
+        try:
+            with open(self.path) as fd:
+                state = json.load(fd)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logging.warning("Broken checkpoint %s, loading %s from the start", self.path, self.fn)
+            return
+        if any(state.get(name) != value for name, value in self._identity().items()):
+            logging.warning("Checkpoint %s is for another version of %s, loading from the start", self.path, self.fn)
+            return
+        self.line = int(state["line"])
+        self.offset = int(state["offset"])
+
+    def register(self, seq, batches, line, offset):
+        """Запоминает пачку seq, заканчивающуюся строкой line, и возвращает её задачи с пометкой seq."""
+        tagged = {addr: [(key, packed, seq) for key, packed in items] for addr, items in batches.items()}
+        with self.lock:
+            self.pending[seq] = [sum(map(len, tagged.values())), line, offset]
+            self._advance()
+        return tagged
+
+    def ack(self, batch, failed_keys=()):
+        counts = collections.Counter(item[2] for item in batch)
+        if failed_keys:
+            failed_keys = set(failed_keys)
+            failed = {item[2] for item in batch if item[0] in failed_keys}
+        else:
+            failed = ()
+        with self.lock:
+            for seq, count in counts.items():
+                self.pending[seq][0] -= count
+            self.failed.update(failed)
+            self._advance()
+
+    def _advance(self):
+        while self.pending:
+            seq, (remaining, line, offset) = next(iter(self.pending.items()))
+            if remaining or seq in self.failed:
+                return
+            del self.pending[seq]
+            self.line, self.offset = line, offset
+
+    def save(self):
+        with self.lock:
+            state = dict(self._identity(), line=self.line, offset=self.offset)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fd:
+            json.dump(state, fd)
+        os.replace(tmp, self.path)
+        self.saved_at = time.monotonic()
+
+    def maybe_save(self):
+        if time.monotonic() - self.saved_at >= self.interval:
+            self.save()
+
+    def finish(self):
+        """Файл догружен: отметка больше не нужна."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class LatencyHistogram:
+    """Гистограмма задержек в миллисекундах с фиксированными корзинами."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, seconds):
+        ms = seconds * 1000.0
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попал q-квантиль (для последней корзины — максимум)."""
+        count = self.count
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, bucket in enumerate(self.counts):
+            seen += bucket
+            if bucket and seen >= rank:
+                return float(self.bounds[i]) if i < len(self.bounds) else self.max_ms
+        return self.max_ms
+
+    def as_dict(self):
+        count = self.count
+        return {
+            "count": count,
+            "avg": round(self.total_ms / count, 3) if count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": round(self.max_ms, 3),
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+        }
 
 
 class WorkerStats:
+    """Счётчики одного потока-писателя: пишет в них только он сам, остальные лишь читают."""
+
     def __init__(self):
         self.processed = 0
         self.errors = 0
+        self.batches = 0
+        self.retries = 0
+        self.latency = LatencyHistogram()
+
+    def merge(self, other):
+        self.processed += other.processed
+        self.errors += other.errors
+        self.batches += other.batches
+        self.retries += other.retries
+        self.latency.merge(other.latency)
+        return self
+
+
+class LoadMetrics:
+    """Метрики загрузки одного файла: строки парсера, счётчики писателей и глубина очередей.
+
+    Счётчики читаются без блокировок, поэтому промежуточные снимки приблизительные;
+    после join() писателей снимок точный.
+    """
+
+    def __init__(self, fn, q_by_addr, workers, clock=time.monotonic):
+        self.fn = fn
+        self.q_by_addr = q_by_addr
+        self.workers = workers
+        self.clock = clock
+        self.started = clock()
+        self.lines = 0
+        self.stalls = {}
+
+    def stall(self, addr, seconds):
+        self.stalls[addr] = self.stalls.get(addr, 0.0) + seconds
+
+    def stats_by_addr(self):
+        stats = {addr: WorkerStats() for addr in self.q_by_addr}
+        for worker in self.workers:
+            stats[worker.memc_addr].merge(worker.stats)
+        return stats
+
+    def snapshot(self):
+        elapsed = max(self.clock() - self.started, 1e-9)
+        addrs = {}
+        for addr, stats in self.stats_by_addr().items():
+            addrs[addr] = {
+                "processed": stats.processed,
+                "errors": stats.errors,
+                "keys_per_sec": round(stats.processed / elapsed, 1),
+                "batches": stats.batches,
+                "retries": stats.retries,
+                "queue_depth": self.q_by_addr[addr].qsize(),
+                "parser_wait_sec": round(self.stalls.get(addr, 0.0), 3),
+                "batch_size": [worker.sizer.size for worker in self.workers if worker.memc_addr == addr],
+                "set_multi_ms": stats.latency.as_dict(),
+            }
+        return {
+            "file": self.fn,
+            "elapsed": round(elapsed, 3),
+            "lines": self.lines,
+            "lines_per_sec": round(self.lines / elapsed, 1),
+            "addrs": addrs,
+        }
+
+    def log(self):
+        snapshot = self.snapshot()
+        logging.info("%s: %s lines, %s lines/s", os.path.basename(self.fn), snapshot["lines"],
+                     snapshot["lines_per_sec"])
+        for addr, m in snapshot["addrs"].items():
+            logging.info(
+                "  %s: %s keys/s, queue=%s, parser wait=%ss, batch=%s, retries=%s, errors=%s, "
+                "set_multi p50=%sms p99=%sms",
+                addr, m["keys_per_sec"], m["queue_depth"], m["parser_wait_sec"], m["batch_size"], m["retries"],
+                m["errors"],
+                m["set_multi_ms"]["p50"], m["set_multi_ms"]["p99"],
+            )
 
+    def dump(self, metrics_dir=None):
+        """Пишет итоговый снимок в <metrics_dir>/<файл>.metrics.json, без каталога — одной строкой в лог."""
+        snapshot = self.snapshot()
+        if not metrics_dir:
+            logging.info("Metrics: %s", json.dumps(snapshot, sort_keys=True))
+            return None
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(metrics_dir, os.path.basename(self.fn) + ".metrics.json")
+        with open(path, "w") as fd:
+            json.dump(snapshot, fd, indent=2, sort_keys=True)
+        return path
+
+
+class BatchSizer:
+    """AIMD: пока set_multi укладывается в бюджет задержки, пачка растёт на step, иначе уменьшается вдвое.
+
+    С latency_budget=0 размер пачки фиксирован.
+    """
+
+    def __init__(self, size, max_size=None, latency_budget=0.0, min_size=1):
+        self.min_size = max(1, int(min_size))
+        self.size = max(self.min_size, int(size))
+        self.max_size = max(self.size, int(max_size or self.size))
+        self.latency_budget = float(latency_budget or 0.0)
+        self.step = max(1, self.size // 8)
+
+    def update(self, latency, ok=True):
+        if not self.latency_budget:
+            return self.size
+        if ok and latency <= self.latency_budget:
+            self.size = min(self.max_size, self.size + self.step)
+        else:
+            self.size = max(self.min_size, self.size // 2)
+        return self.size
+
+
+def feed_queues(batches, q_by_addr, metrics=None, wait=BACKPRESSURE_WAIT):
+    """Раскладывает {addr: [item, ...]} по очередям, не застревая на одной переполненной.
+
+    Пока очередь адреса полна, кормятся остальные; если полны все, парсер ждёт
+    освобождения первой не дольше wait сек за раз, а время простоя копится в metrics.
+    """
+    pending = [[addr, items, 0] for addr, items in batches.items() if items]
+    while pending:
+        progressed = False
+        for entry in pending:
+            addr, items, position = entry
+            put = q_by_addr[addr].put_nowait
+            try:
+                while position < len(items):
+                    put(items[position])
+                    position += 1
+            except queue.Full:
+                pass
+            if position > entry[2]:
+                progressed = True
+                entry[2] = position
+        pending = [entry for entry in pending if entry[2] < len(entry[1])]
+        if pending and not progressed:
+            entry = pending[0]
+            addr = entry[0]
+            started = time.monotonic()
+            try:
+                q_by_addr[addr].put(entry[1][entry[2]], timeout=wait)
+                entry[2] += 1
+            except queue.Full:
+                logging.warning("Queue for %s is full for %.1fs: writers do not keep up", addr, wait)
+            if metrics is not None:
+                metrics.stall(addr, time.monotonic() - started)
+
+
+class MetricsReporter(threading.Thread):
+    def __init__(self, metrics, interval):
+        super().__init__()
+        self.daemon = True
+        self.metrics = metrics
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.metrics.log()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+
+def valid_key(key):
+    return 0 < len(key) <= MAX_KEY_LENGTH and not any(c <= 32 or c == 127 for c in key)
+
+
+def encode_set_commands(items):
+    """items: [(key, value)] -> (ключи, команды set текстового протокола, ключи-отказы)."""
+    keys = []
+    commands = []
+    failed = []
+    for item in items:
+        key, value = item[0], item[1]
+        raw_key = key.encode("utf-8") if isinstance(key, str) else key
+        if not valid_key(raw_key):
+            failed.append(key)
+            continue
+        keys.append(key)
+        commands.append(b"set %s 0 0 %d\r\n%s\r\n" % (raw_key, len(value), value))
+    return keys, commands, failed
+
+
+class MemcacheConnection:
+    """Долгоживущее соединение с memcached: вся пачка set уходит одним sendall, ответы читаются разом."""
+
+    def __init__(self, memc_addr, socket_timeout):
+        host, port = memc_addr.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.socket_timeout = socket_timeout
+        self.sock = None
+        self.last_used = 0.0
+        self._buffer = bytearray()
+
+    def connect(self):
+        self.close()
+        self.sock = socket.create_connection(self.address, timeout=self.socket_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self._buffer = bytearray()
+
+    def _read_replies(self, count):
+        replies = []
+        buf = self._buffer
+        start = 0
+        while len(replies) < count:
+            end = buf.find(b"\r\n", start)
+            if end < 0:
+                chunk = self.sock.recv(256 * 1024)
+                if not chunk:
+                    raise ConnectionError("memcached closed connection")
+                buf += chunk
+                continue
+            replies.append(bytes(buf[start:end]))
+            start = end + 2
+        del buf[:start]
+        return replies
+
+    def ping(self):
+        self.sock.sendall(b"version\r\n")
+        return self._read_replies(1)[0].startswith(b"VERSION")
+
+    def set_multi(self, items):
+        """items: [(key, value)] -> список ключей, которые не записались."""
+        keys, commands, failed = encode_set_commands(items)
+        if not commands:
+            return failed
+
+        self.sock.sendall(b"".join(commands))
+        replies = self._read_replies(len(commands))
+        self.last_used = time.monotonic()
+        failed.extend(key for key, reply in zip(keys, replies) if reply != b"STORED")
+        return failed
+
+
+class MemcachePool:
+    """Пул соединений к одному адресу memcached с проверкой живости и переподключением.
+
+    Соединение, простоявшее дольше health_interval, перед использованием проверяется
+    командой version. Сломанное соединение закрывается; после неудачного подключения
+    адрес считается недоступным на время, растущее экспоненциально до backoff_max.
+    """
+
+    def __init__(self, memc_addr, size, socket_timeout,
+                 health_interval=HEALTH_CHECK_INTERVAL, backoff=RECONNECT_BACKOFF,
+                 backoff_max=RECONNECT_BACKOFF_MAX):
+        self.memc_addr = memc_addr
+        self.size = max(1, int(size))
+        self.socket_timeout = float(socket_timeout)
+        self.health_interval = health_interval
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._connect_failures = 0
+        self._down_until = 0.0
+        self.reconnects = 0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return MemcacheConnection(self.memc_addr, self.socket_timeout)
+        return self._idle.get()
+
+    def _release(self, conn):
+        self._idle.put(conn)
+
+    def _ensure_connected(self, conn):
+        if conn.sock is not None:
+            if time.monotonic() - conn.last_used < self.health_interval:
+                return
+            try:
+                if conn.ping():
+                    conn.last_used = time.monotonic()
+                    return
+            except OSError:
+                pass
+            logging.warning("%s - health check failed, reconnecting", self.memc_addr)
+            conn.close()
+
+        with self._lock:
+            wait = self._down_until - time.monotonic()
+        if wait > 0:
+            raise ConnectionError(f"{self.memc_addr} is down, next reconnect in {wait:.2f}s")
+        try:
+            conn.connect()
+        except OSError:
+            with self._lock:
+                self._connect_failures += 1
+                delay = min(self.backoff_max, self.backoff * 2 ** (self._connect_failures - 1))
+                self._down_until = time.monotonic() + delay
+            raise
+        with self._lock:
+            self._connect_failures = 0
+            self.reconnects += 1
+
+    def set_multi(self, items):
+        conn = self._acquire()
+        try:
+            self._ensure_connected(conn)
+            return conn.set_multi(items)
+        except OSError:
+            conn.close()
+            raise
+        finally:
+            self._release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
 
 
 class MemcacheWorker(threading.Thread):
-    def __init__(self, memc_addr, q, dry_run, batch_size, socket_timeout, retry, retry_backoff, stats, stats_lock):
+    def __init__(self, memc_addr, q, dry_run, batch_size, socket_timeout, retry, retry_backoff, stats=None,
+                 connections=None, flush_interval=FLUSH_INTERVAL, latency_budget=0.0, batch_max=BATCH_MAX,
+                 checkpoint=None):
         super().__init__()
         self.daemon = True
         self.memc_addr = memc_addr
         self.q = q
         self.dry_run = dry_run
-        self.batch_size = max(1, int(batch_size))
+        self.sizer = BatchSizer(batch_size, batch_max, latency_budget)
+        # Неполная пачка уходит не позже чем через flush_interval сек после первого элемента.
+        self.flush_interval = float(flush_interval or 0.0)
         self.socket_timeout = float(socket_timeout)
         self.retry = max(0, int(retry))
         self.retry_backoff = float(retry_backoff)
 
-        self.stats = stats
-        self.stats_lock = stats_lock
+        # У каждого потока свои счётчики: без блокировок на горячем пути.
+        self.stats = stats if stats is not None else WorkerStats()
 
+        self.connections = connections
+        self.checkpoint = checkpoint
         self._client = None
 
+    def _set_multi(self, batch):
+        if self.connections is not None:
+            return len(batch), self.connections.set_multi(batch)
+        payload = {item[0]: item[1] for item in batch}
+        return len(payload), self._get_client().set_multi(payload)
+
     def _get_client(self):
 
         if self._client is None:
@@ -100,54 +763,294 @@ class MemcacheWorker(threading.Thread):
         if not batch:
             return
 
+        stats = self.stats
         if self.dry_run:
-            with self.stats_lock:
-                self.stats.ok += len(batch)
+            stats.processed += len(batch)
             return
 
-        payload = dict(batch)
-        client = self._get_client()
-
         attempt = 0
         while True:
+            started = time.perf_counter()
             try:
-                failed_keys = client.set_multi(payload)
+                sent, failed_keys = self._set_multi(batch)
+                elapsed = time.perf_counter() - started
+                stats.latency.observe(elapsed)
+                stats.batches += 1
+                self.sizer.update(elapsed, ok=not failed_keys)
                 if failed_keys:
-                    with self.stats_lock:
-                        self.stats.err += len(failed_keys)
-                        self.stats.ok += (len(payload) - len(failed_keys))
+                    stats.errors += len(failed_keys)
+                    stats.processed += (sent - len(failed_keys))
                     logging.error("%s - failed keys: %s", self.memc_addr, len(failed_keys))
                 else:
-                    with self.stats_lock:
-                        self.stats.ok += len(payload)
+                    stats.processed += sent
+                if self.checkpoint is not None:
+                    self.checkpoint.ack(batch, failed_keys)
                 return
             except Exception as e:
+                stats.latency.observe(time.perf_counter() - started)
+                self.sizer.update(0.0, ok=False)
                 attempt += 1
                 logging.exception("Cannot write to memc %s (attempt %s): %s", self.memc_addr, attempt, e)
                 if attempt > self.retry:
-                    with self.stats_lock:
-                        self.stats.err += len(payload)
+                    stats.errors += len(batch)
+                    if self.checkpoint is not None:
+                        self.checkpoint.ack(batch, [item[0] for item in batch])
                     return
+                stats.retries += 1
                 time.sleep(self.retry_backoff * attempt)
 
     def run(self):
 
         batch = []
+        deadline = None
         while True:
-            item = self.q.get()
+            try:
+                item = self.q.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self._flush(batch)
+                batch = []
+                deadline = None
+                continue
             try:
                 if item is None:
 
                     self._flush(batch)
                     return
+                if not batch and self.flush_interval:
+                    deadline = time.monotonic() + self.flush_interval
                 batch.append(item)
-                if len(batch) >= self.batch_size:
+                if len(batch) >= self.sizer.size or deadline is not None and time.monotonic() >= deadline:
                     self._flush(batch)
                     batch = []
+                    deadline = None
             finally:
                 self.q.task_done()
 
 
+class AsyncMemcacheConnection:
+    """То же конвейерное соединение, что MemcacheConnection, поверх asyncio streams."""
+
+    def __init__(self, memc_addr, socket_timeout):
+        host, port = memc_addr.rsplit(":", 1)
+        self.host = host
+        self.port = int(port)
+        self.socket_timeout = socket_timeout
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        await self.close()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.socket_timeout
+        )
+
+    async def close(self):
+        writer = self.writer
+        self.reader = self.writer = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _exchange(self, payload, count):
+        self.writer.write(payload)
+        await self.writer.drain()
+        replies = []
+        for _ in range(count):
+            reply = await self.reader.readline()
+            if not reply:
+                raise ConnectionError("memcached closed connection")
+            replies.append(reply.rstrip(b"\r\n"))
+        return replies
+
+    async def set_multi(self, items):
+        keys, commands, failed = encode_set_commands(items)
+        if not commands:
+            return failed
+        if self.writer is None:
+            await self.connect()
+        try:
+            replies = await asyncio.wait_for(self._exchange(b"".join(commands), len(commands)), self.socket_timeout)
+        except (OSError, asyncio.TimeoutError):
+            await self.close()
+            raise
+        failed.extend(key for key, reply in zip(keys, replies) if reply != b"STORED")
+        return failed
+
+
+class AsyncMemcacheWriter:
+    """Корутина-писатель для --engine asyncio: одна пачка в полёте на своём соединении.
+
+    Пачки собираются так же, как в MemcacheWorker: по размеру от BatchSizer или по
+    истечении flush_interval после первого элемента.
+    """
+
+    def __init__(self, memc_addr, q, dry_run, batch_size, socket_timeout, retry, retry_backoff,
+                 flush_interval=FLUSH_INTERVAL, latency_budget=0.0, batch_max=BATCH_MAX, checkpoint=None):
+        self.memc_addr = memc_addr
+        self.q = q
+        self.dry_run = dry_run
+        self.retry = max(0, int(retry))
+        self.retry_backoff = float(retry_backoff)
+        self.flush_interval = float(flush_interval or 0.0)
+        self.sizer = BatchSizer(batch_size, batch_max, latency_budget)
+        self.stats = WorkerStats()
+        self.connection = AsyncMemcacheConnection(memc_addr, float(socket_timeout))
+        self.checkpoint = checkpoint
+
+    async def _flush(self, batch):
+        stats = self.stats
+        if self.dry_run:
+            stats.processed += len(batch)
+            return
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                failed_keys = await self.connection.set_multi(batch)
+                elapsed = time.perf_counter() - started
+                stats.latency.observe(elapsed)
+                stats.batches += 1
+                self.sizer.update(elapsed, ok=not failed_keys)
+                if failed_keys:
+                    logging.error("%s - failed keys: %s", self.memc_addr, len(failed_keys))
+                stats.errors += len(failed_keys)
+                stats.processed += len(batch) - len(failed_keys)
+                if self.checkpoint is not None:
+                    self.checkpoint.ack(batch, failed_keys)
+                return
+            except Exception as e:
+                stats.latency.observe(time.perf_counter() - started)
+                self.sizer.update(0.0, ok=False)
+                attempt += 1
+                logging.exception("Cannot write to memc %s (attempt %s): %s", self.memc_addr, attempt, e)
+                if attempt > self.retry:
+                    stats.errors += len(batch)
+                    if self.checkpoint is not None:
+                        self.checkpoint.ack(batch, [item[0] for item in batch])
+                    return
+                stats.retries += 1
+                await asyncio.sleep(self.retry_backoff * attempt)
+
+    async def _next_batch(self):
+        """Возвращает (пачка, пришёл ли sentinel)."""
+        item = await self.q.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.sizer.size:
+            try:
+                item = self.q.get_nowait()
+            except asyncio.QueueEmpty:
+                if not self.flush_interval:
+                    item = await self.q.get()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.q.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def run(self):
+        try:
+            while True:
+                batch, done = await self._next_batch()
+                if batch:
+                    await self._flush(batch)
+                if done:
+                    return
+        finally:
+            await self.connection.close()
+
+
+async def report_metrics(metrics, interval):
+    while True:
+        await asyncio.sleep(interval)
+        metrics.log()
+
+
+async def load_file_async(fn, rings, addrs, dry_run, chunk_lines, pool, parsers, queue_size, inflight,
+                          metrics_interval, metrics_dir, checkpoint=None, **writer_options):
+    """--engine asyncio: один цикл событий, до inflight пачек в полёте на каждый адрес.
+
+    Чтение и разбор .gz идут в отдельном потоке (или в пуле парсеров), готовые
+    (key, packed) приходят писателям через asyncio.Queue с ограниченным размером.
+    """
+    loop = asyncio.get_running_loop()
+    q_by_addr = {addr: asyncio.Queue(maxsize=queue_size) for addr in addrs}
+    writers = [
+        AsyncMemcacheWriter(addr, q_by_addr[addr], dry_run, checkpoint=checkpoint, **writer_options)
+        for addr in addrs
+        for _ in range(inflight)
+    ]
+    tasks = [loop.create_task(writer.run()) for writer in writers]
+    metrics = LoadMetrics(fn, q_by_addr, writers)
+    reporter = loop.create_task(report_metrics(metrics, metrics_interval)) if metrics_interval > 0 else None
+
+    errors_parse = errors_unknown = 0
+    start_line = checkpoint.line if checkpoint is not None else 0
+    chunks = iter_parsed_chunks(fn, rings, dry_run, chunk_lines, pool, parsers, start_line)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            for seq in itertools.count():
+                parsed = await loop.run_in_executor(reader, next, chunks, None)
+                if parsed is None:
+                    break
+                line_no, offset, (batches, chunk_errors_parse, chunk_errors_unknown) = parsed
+                errors_parse += chunk_errors_parse
+                errors_unknown += chunk_errors_unknown
+                metrics.lines += chunk_errors_parse + chunk_errors_unknown + sum(map(len, batches.values()))
+                if checkpoint is not None:
+                    batches = checkpoint.register(seq, batches, line_no, offset)
+                    checkpoint.maybe_save()
+                for memc_addr, items in batches.items():
+                    q = q_by_addr[memc_addr]
+                    for item in items:
+                        if q.full():
+                            started = loop.time()
+                            await q.put(item)
+                            metrics.stall(memc_addr, loop.time() - started)
+                        else:
+                            q.put_nowait(item)
+
+        for q in q_by_addr.values():
+            for _ in range(inflight):
+                await q.put(None)
+        pending = set(tasks)
+        while pending:
+            _, pending = await asyncio.wait(pending, timeout=DRAIN_POLL)
+            if checkpoint is not None:
+                checkpoint.maybe_save()
+        await asyncio.gather(*tasks)
+    except BaseException:
+        if checkpoint is not None:
+            checkpoint.save()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+    metrics.dump(metrics_dir)
+
+    stats = metrics.stats_by_addr()
+    processed_ok = sum(s.processed for s in stats.values())
+    errors_write = sum(s.errors for s in stats.values())
+    return processed_ok, errors_parse + errors_unknown + errors_write
+
+
 def process_file(
     fn,
     device_memc,
@@ -158,23 +1061,65 @@ def process_file(
     socket_timeout,
     retry,
     retry_backoff,
+    parsers=0,
+    chunk_lines=CHUNK_LINES,
+    pool=None,
+    client="pool",
+    metrics_interval=0,
+    metrics_dir=None,
+    flush_interval=FLUSH_INTERVAL,
+    latency_budget=0.0,
+    batch_max=BATCH_MAX,
+    engine="threads",
+    inflight=ASYNC_INFLIGHT,
+    checkpoint_interval=0,
 ):
 
-    addrs = sorted(set(device_memc.values()))
+    rings = make_rings(device_memc)
+    addrs = sorted(set(addr for ring in rings.values() for addr in ring.nodes))
     if not addrs:
         logging.error("No memcache addresses provided")
         return 0, 0
 
+    parsers = max(0, int(parsers or 0))
+    own_pool = pool is None and parsers > 0
+    if own_pool:
+        pool = start_parser_pool(parsers)
+
 
     qsize = int(queue_size) if queue_size is not None else 0
+
+    checkpoint = None
+    if checkpoint_interval and checkpoint_interval > 0 and not dry_run:
+        checkpoint = LoadCheckpoint(fn, checkpoint_interval)
+        if checkpoint.line:
+            logging.info("Resuming %s from line %s (compressed offset %s)", fn, checkpoint.line, checkpoint.offset)
+
+    if engine == "asyncio":
+        try:
+            result = asyncio.run(load_file_async(
+                fn, rings, addrs, dry_run, chunk_lines, pool, parsers, qsize, max(1, int(inflight or 1)),
+                metrics_interval or 0, metrics_dir, checkpoint,
+                batch_size=batch_size, socket_timeout=socket_timeout, retry=retry, retry_backoff=retry_backoff,
+                flush_interval=flush_interval, latency_budget=latency_budget, batch_max=batch_max,
+            ))
+        finally:
+            if own_pool:
+                pool.shutdown()
+        if checkpoint is not None:
+            checkpoint.finish()
+        return result
     q_by_addr = {addr: queue.Queue(maxsize=qsize) for addr in addrs}
 
 
     workers_per_addr = max(1, int(workers or 1))
 
 
-    stats_lock = threading.Lock()
-    stats_by_addr = {addr: WorkerStats() for addr in addrs}
+    connections_by_addr = {}
+    if client == "pool" and not dry_run:
+        connections_by_addr = {
+            addr: MemcachePool(addr, workers_per_addr, socket_timeout) for addr in addrs
+        }
 
 
     threads = []
@@ -188,54 +1133,71 @@ def process_file(
                 socket_timeout=socket_timeout,
                 retry=retry,
                 retry_backoff=retry_backoff,
-                stats=stats_by_addr[addr],
-                stats_lock=stats_lock,
+                connections=connections_by_addr.get(addr),
+                flush_interval=flush_interval,
+                latency_budget=latency_budget,
+                batch_max=batch_max,
+                checkpoint=checkpoint,
             )
             t.start()
             threads.append(t)
 
+    metrics = LoadMetrics(fn, q_by_addr, threads)
+    reporter = None
+    if metrics_interval and metrics_interval > 0:
+        reporter = MetricsReporter(metrics, metrics_interval)
+        reporter.start()
+
     errors_parse = 0
     errors_unknown = 0
 
     logging.info("Processing %s", fn)
 
 
-    with gzip.open(fn, "rt", encoding="utf-8", errors="replace") as fd:
-        for line in fd:
-            line = line.rstrip("\r\n")
-            if not line:
-                continue
-
-            appsinstalled = parse_appsinstalled(line)
-            if not appsinstalled:
-                errors_parse += 1
-                continue
-
-            memc_addr = device_memc.get(appsinstalled.dev_type)
-            if not memc_addr:
-                errors_unknown += 1
-                logging.error("Unknown device type: %s", appsinstalled.dev_type)
-                continue
-
-            key, packed, ua = make_key_and_value(appsinstalled)
-
-            if dry_run:
-                logging.debug("%s - %s -> %s", memc_addr, key, str(ua).replace("\n", " "))
-
-            q_by_addr[memc_addr].put((key, packed))
-
-
-    for addr in addrs:
-        for _ in range(workers_per_addr):
-            q_by_addr[addr].put(None)
-
-
-    for addr in addrs:
-        q_by_addr[addr].join()
-    for t in threads:
-        t.join()
-
-
+    try:
+        parsed_chunks = iter_parsed_chunks(
+            fn, rings, dry_run, chunk_lines, pool, parsers, checkpoint.line if checkpoint is not None else 0
+        )
+        for seq, (line_no, offset, (batches, chunk_errors_parse, chunk_errors_unknown)) in enumerate(parsed_chunks):
+            errors_parse += chunk_errors_parse
+            errors_unknown += chunk_errors_unknown
+            metrics.lines += chunk_errors_parse + chunk_errors_unknown + sum(map(len, batches.values()))
+            if checkpoint is not None:
+                batches = checkpoint.register(seq, batches, line_no, offset)
+                checkpoint.maybe_save()
+            feed_queues(batches, q_by_addr, metrics)
+        if own_pool:
+            pool.shutdown()
+            own_pool = False
+
+        for addr in addrs:
+            for _ in range(workers_per_addr):
+                q_by_addr[addr].put(None)
+
+        # Пока очереди досылаются, подтверждения продолжают сохраняться.
+        for t in threads:
+            while t.is_alive():
+                t.join(DRAIN_POLL)
+                if checkpoint is not None:
+                    checkpoint.maybe_save()
+    except BaseException:
+        # Падаем: сохраняем то, что писатели уже успели подтвердить.
+        if checkpoint is not None:
+            checkpoint.save()
+        raise
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    for connections in connections_by_addr.values():
+        connections.close()
+    if reporter is not None:
+        reporter.stop()
+    if checkpoint is not None:
+        checkpoint.finish()
+    metrics.dump(metrics_dir)
+
+    stats_by_addr = metrics.stats_by_addr()
     processed_ok = sum(stats_by_addr[addr].processed for addr in addrs)
     errors_write = sum(stats_by_addr[addr].errors for addr in addrs)
 
@@ -258,35 +1220,108 @@ def main(options):
         logging.warning("No files matched pattern: %s", options.pattern)
         return 0
 
-    for fn in files:
-        processed, errors = process_file(
-            fn=fn,
-            device_memc=device_memc,
-            dry_run=options.dry,
-            workers=options.workers,
-            batch_size=options.batch,
-            queue_size=options.queue_size,
-            socket_timeout=options.timeout,
-            retry=options.retry,
-            retry_backoff=options.retry_backoff,
-        )
+    if options.file_workers > 1:
+        return load_files_parallel(files, device_memc, options)
 
+    pool = start_parser_pool(options.parsers) if options.parsers > 0 else None
+    try:
+        return load_files(files, device_memc, options, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def process_file_options(options):
+    return dict(
+        dry_run=options.dry,
+        workers=options.workers,
+        batch_size=options.batch,
+        queue_size=options.queue_size,
+        socket_timeout=options.timeout,
+        retry=options.retry,
+        retry_backoff=options.retry_backoff,
+        chunk_lines=options.chunk_lines,
+        client=options.client,
+        metrics_interval=options.metrics_interval,
+        metrics_dir=options.metrics_dir,
+        flush_interval=options.flush_ms / 1000.0,
+        latency_budget=options.latency_budget_ms / 1000.0,
+        batch_max=options.batch_max,
+        engine=options.engine,
+        inflight=options.inflight,
+        checkpoint_interval=options.checkpoint_interval,
+    )
 
-        if not processed:
-            dot_rename(fn)
-            logging.warning("No records processed, file renamed anyway: %s", fn)
-            continue
 
-        err_rate = float(errors) / float(processed)
-        if err_rate < NORMAL_ERR_RATE:
-            logging.info("Acceptable error rate (%s). Successful load", err_rate)
-        else:
-            logging.error("High error rate (%s > %s). Failed load", err_rate, NORMAL_ERR_RATE)
+def finish_file(fn, processed, errors):
+    if not processed:
+        dot_rename(fn)
+        logging.warning("No records processed, file renamed anyway: %s", fn)
+        return False
 
+    err_rate = float(errors) / float(processed)
+    if err_rate < NORMAL_ERR_RATE:
+        logging.info("Acceptable error rate (%s). Successful load: %s", err_rate, fn)
+        ok = True
+    else:
+        logging.error("High error rate (%s > %s). Failed load: %s", err_rate, NORMAL_ERR_RATE, fn)
+        ok = False
+
+    dot_rename(fn)
+    return ok
 
-        dot_rename(fn)
 
-    return 0
+def load_files(files, device_memc, options, pool=None):
+    """Код выхода тот же, что у load_files_parallel: 1, если хоть один файл не загрузился."""
+    failed = 0
+    for fn in files:
+        try:
+            processed, errors = process_file(
+                fn=fn,
+                device_memc=device_memc,
+                parsers=options.parsers,
+                pool=pool,
+                **process_file_options(options)
+            )
+        except Exception:
+            logging.exception("Cannot load %s, later files are left for the next run", fn)
+            return 1
+        if not finish_file(fn, processed, errors):
+            failed += 1
+    return 1 if failed else 0
+
+
+def load_files_parallel(files, device_memc, options):
+    """Файлы грузятся в file_workers процессах, у каждого свои потоки-писатели.
+
+    Переименование идёт строго в хронологическом порядке: результат файла ждёт,
+    пока не будут переименованы все файлы до него.
+    """
+    if options.parsers:
+        logging.warning("--parsers is ignored with --file-workers: files are parsed in their own processes")
+    file_options = process_file_options(options)
+
+    total_processed = total_errors = failed = 0
+    with ProcessPoolExecutor(max_workers=options.file_workers) as pool:
+        futures = [pool.submit(process_file, fn, device_memc, **file_options) for fn in files]
+        for fn, future in zip(files, futures):
+            try:
+                processed, errors = future.result()
+            except Exception:
+                logging.exception("Cannot load %s, later files are left for the next run", fn)
+                for rest in futures:
+                    rest.cancel()
+                return 1
+            total_processed += processed
+            total_errors += errors
+            if not finish_file(fn, processed, errors):
+                failed += 1
+
+    logging.info(
+        "Loaded %s files: processed=%s errors=%s failed=%s",
+        len(files), total_processed, total_errors, failed,
+    )
+    return 1 if failed else 0
 
 
 def prototest():
@@ -298,7 +1333,12 @@ def prototest():
     for line in sample.splitlines():
         ai = parse_appsinstalled(line)
         assert ai is not None
-        _, packed, ua = make_key_and_value(ai)
+        _, packed = make_key_and_value(ai)
+        ua = appsinstalled_pb2.UserApps()
+        ua.lat = ai.lat
+        ua.lon = ai.lon
+        ua.apps.extend(ai.apps)
+        assert packed == ua.SerializeToString()
         unpacked = appsinstalled_pb2.UserApps()
         unpacked.ParseFromString(packed)
         assert ua == unpacked
@@ -316,6 +1356,8 @@ if __name__ == '__main__':
     op.add_option("--pattern", action="store", default="/data/appsinstalled/*.tsv.gz")
 
 
+    # Для каждого dev_type можно указать несколько адресов через запятую:
+    # ключи раскладываются по ним консистентным хешированием.
     op.add_option("--idfa", action="store", default="127.0.0.1:33013")
     op.add_option("--gaid", action="store", default="127.0.0.1:33014")
     op.add_option("--adid", action="store", default="127.0.0.1:33015")
@@ -325,15 +1367,41 @@ if __name__ == '__main__':
     op.add_option("--workers", action="store", type="int", default=0,
                   help="Сколько потоков-писателей. 0 => авто (по числу memcache адресов)")
     op.add_option("--batch", action="store", type="int", default=256,
-                  help="Размер пачки для set_multi()")
+                  help="Размер пачки для set_multi() (начальный, если задан --latency-budget-ms)")
+    op.add_option("--batch-max", action="store", type="int", default=BATCH_MAX,
+                  help="Верхняя граница пачки при подстройке по задержке")
+    op.add_option("--latency-budget-ms", action="store", type="float", default=20.0,
+                  help="Бюджет задержки set_multi (мс): пачка растёт, пока укладывается, и вдвое "
+                       "уменьшается при превышении или ошибке. 0 => фиксированный --batch")
+    op.add_option("--flush-ms", action="store", type="float", default=FLUSH_INTERVAL * 1000,
+                  help="Неполная пачка отправляется не позже чем через столько мс. 0 => только по заполнению")
     op.add_option("--queue-size", action="store", type="int", default=50000,
                   help="Макс. размер очереди задач на 1 адрес memcache")
+    op.add_option("--client", action="store", type="choice", choices=["pool", "memcache"], default="pool",
+                  help="pool => свои долгоживущие соединения с конвейерной записью, memcache => python-memcached")
+    op.add_option("--engine", action="store", type="choice", choices=["threads", "asyncio"], default="threads",
+                  help="threads => потоки MemcacheWorker, asyncio => один цикл событий и корутины-писатели")
+    op.add_option("--inflight", action="store", type="int", default=ASYNC_INFLIGHT,
+                  help="Сколько пачек одновременно в полёте на 1 адрес memcache при --engine asyncio")
+    op.add_option("--checkpoint-interval", action="store", type="float", default=CHECKPOINT_INTERVAL,
+                  help="Как часто (сек) сохранять в <файл>.checkpoint, докуда файл подтверждён писателями. "
+                       "При перезапуске эти строки пропускаются. 0 => без отметок")
     op.add_option("--timeout", action="store", type="float", default=1.0,
-                  help="socket_timeout для python-memcached (сек)")
+                  help="Таймаут сокета memcache (сек)")
     op.add_option("--retry", action="store", type="int", default=1,
                   help="Сколько раз повторять отправку пачки при исключении")
     op.add_option("--retry-backoff", action="store", type="float", default=0.05,
                   help="Базовая задержка между ретраями (сек), умножается на номер попытки")
+    op.add_option("--parsers", action="store", type="int", default=0,
+                  help="Сколько процессов разбирают строки и сериализуют protobuf. 0 => в основном потоке")
+    op.add_option("--file-workers", action="store", type="int", default=1,
+                  help="Сколько файлов грузить одновременно (в отдельных процессах)")
+    op.add_option("--chunk-lines", action="store", type="int", default=CHUNK_LINES,
+                  help="Сколько строк отдавать процессу-парсеру за раз")
+    op.add_option("--metrics-interval", action="store", type="float", default=METRICS_INTERVAL,
+                  help="Как часто печатать метрики загрузки (сек). 0 => только итог по файлу")
+    op.add_option("--metrics-dir", action="store", default=None,
+                  help="Каталог для <файл>.metrics.json с итоговыми метриками. Без него итог пишется в лог")
 
     (opts, _args) = op.parse_args()
 
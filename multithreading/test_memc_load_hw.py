@@ -1,10 +1,18 @@
+import collections
 import gzip
-import os
+import json
+import queue
+import random
+import threading
+import time
+
 from pathlib import Path
+from types import SimpleNamespace
 
+import memc_load_hw as ml
 import pytest
 
-import memc_load_hw as ml
+from fake_memcached import AsyncFakeMemcached, FakeMemcached
 
 
 class FakeMemcacheClient:
@@ -83,6 +91,7 @@ def test_process_file_writes_to_right_memc(tmp_path, fake_memcache):
         socket_timeout=1.0,
         retry=0,
         retry_backoff=0.0,
+        client="memcache",
     )
 
     assert processed == 3
@@ -107,3 +116,484 @@ def test_iter_files_chronological_sorts(tmp_path):
         "20170929000100.tsv.gz",
         "20170929000200.tsv.gz",
     ]
+
+
+def test_parse_appsinstalled_skips_non_digit_apps():
+    ai = ml.parse_appsinstalled("idfa\tabc\t1.0\t2.0\t1, x,3")
+    assert ai.apps == [1, 3]
+
+
+def test_parse_lines_groups_by_addr():
+    device_memc = {"idfa": "a:1", "gaid": "b:2"}
+    lines = [
+        b"idfa\tid1\t1.0\t2.0\t10,11\n",
+        b"gaid\tid2\t3.0\t4.0\t12\n",
+        b"adid\tid3\t3.0\t4.0\t12\n",
+        b"broken\n",
+        b"\n",
+    ]
+
+    batches, errors_parse, errors_unknown = ml.parse_lines(lines, ml.make_rings(device_memc))
+
+    assert [key for key, _ in batches["a:1"]] == ["idfa:id1"]
+    assert [key for key, _ in batches["b:2"]] == ["gaid:id2"]
+    assert (errors_parse, errors_unknown) == (1, 1)
+
+
+def test_process_file_with_parser_pool(tmp_path, fake_memcache):
+    lines = "".join(f"{('idfa', 'gaid')[i % 2]}\tid{i}\t1.0\t2.0\t{i},7\n" for i in range(500))
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz", lines)
+    device_memc = {"idfa": "127.0.0.1:33013", "gaid": "127.0.0.1:33014"}
+
+    processed, errors = ml.process_file(
+        str(gz),
+        device_memc,
+        dry_run=False,
+        workers=1,
+        batch_size=64,
+        queue_size=100,
+        socket_timeout=1.0,
+        retry=0,
+        retry_backoff=0.0,
+        parsers=2,
+        chunk_lines=37,
+        client="memcache",
+    )
+
+    assert (processed, errors) == (500, 0)
+    assert len(fake_memcache[("127.0.0.1:33013",)].storage) == 250
+    assert len(fake_memcache[("127.0.0.1:33014",)].storage) == 250
+
+
+def test_process_file_against_fake_memcached(tmp_path):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz", "idfa\tid1\t1.0\t2.0\t10,11\ngaid\tid2\t3.0\t4.0\t12\n")
+
+    with FakeMemcached() as idfa, FakeMemcached() as gaid:
+        processed, errors = ml.process_file(
+            str(gz),
+            {"idfa": idfa.address, "gaid": gaid.address},
+            dry_run=False,
+            workers=1,
+            batch_size=10,
+            queue_size=10,
+            socket_timeout=1.0,
+            retry=0,
+            retry_backoff=0.0,
+        )
+
+        assert (processed, errors) == (2, 0)
+        _, packed = idfa.storage[b"idfa:id1"]
+        ua = ml.appsinstalled_pb2.UserApps()
+        ua.ParseFromString(packed)
+        assert list(ua.apps) == [10, 11]
+        assert b"gaid:id2" in gaid.storage
+
+
+def test_main_with_file_workers_renames_in_order(tmp_path, monkeypatch):
+    names = ["20170929000000.tsv.gz", "20170929000100.tsv.gz", "20170929000200.tsv.gz"]
+    for i, name in enumerate(names):
+        lines = "".join(f"idfa\tf{i}id{j}\t1.0\t2.0\t1\n" for j in range(300 * (3 - i)))
+        make_gz(tmp_path, name, lines)
+
+    renamed = []
+    original = ml.dot_rename
+    monkeypatch.setattr(ml, "dot_rename", lambda path: renamed.append(Path(path).name) or original(path))
+
+    with FakeMemcached() as server:
+        options = SimpleNamespace(
+            pattern=str(tmp_path / "*.tsv.gz"), idfa=server.address, gaid=server.address,
+            adid=server.address, dvid=server.address, dry=False, workers=1, batch=50,
+            queue_size=100, timeout=1.0, retry=0, retry_backoff=0.0, parsers=0,
+            chunk_lines=100, file_workers=2, client="pool", metrics_interval=0, metrics_dir=None,
+            flush_ms=100, latency_budget_ms=20, batch_max=1000, engine="threads", inflight=4,
+            checkpoint_interval=10.0,
+        )
+        assert ml.main(options) == 0
+        assert len(server.storage) == 900 + 600 + 300
+
+    assert renamed == names
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["." + name for name in names]
+
+
+@pytest.mark.parametrize("file_workers", [1, 2])
+def test_main_exit_status_does_not_depend_on_file_workers(tmp_path, file_workers):
+    make_gz(tmp_path, "20170929000000.tsv.gz", "idfa\tgood\t1.0\t2.0\t1\n")
+    make_gz(tmp_path, "20170929000100.tsv.gz", "idfa\tbad\n" * 10 + "idfa\tgood\t1.0\t2.0\t1\n")
+
+    with FakeMemcached() as server:
+        options = SimpleNamespace(
+            pattern=str(tmp_path / "*.tsv.gz"), idfa=server.address, gaid=server.address,
+            adid=server.address, dvid=server.address, dry=False, workers=1, batch=50,
+            queue_size=100, timeout=1.0, retry=0, retry_backoff=0.0, parsers=0,
+            chunk_lines=100, file_workers=file_workers, client="pool", metrics_interval=0, metrics_dir=None,
+            flush_ms=100, latency_budget_ms=20, batch_max=1000, engine="threads", inflight=4,
+            checkpoint_interval=10.0,
+        )
+        assert ml.main(options) == 1
+
+
+def reference_user_apps(apps, lat, lon):
+    ua = ml.appsinstalled_pb2.UserApps()
+    ua.lat = lat
+    ua.lon = lon
+    ua.apps.extend(apps)
+    return ua.SerializeToString()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_encode_user_apps_matches_protobuf(seed):
+    rnd = random.Random(seed)
+    edge_apps = [0, 1, 127, 128, 16383, 16384, 2 ** 21, 2 ** 28, 2 ** 32 - 1]
+    edge_coords = [0.0, -0.0, 55.55, -180.0, 1e-300, float("inf")]
+    for _ in range(200):
+        apps = [rnd.choice(edge_apps) if rnd.random() < 0.2 else rnd.randrange(20000)
+                for _ in range(rnd.randrange(0, 40))]
+        lat = rnd.choice(edge_coords) if rnd.random() < 0.2 else rnd.uniform(-90, 90)
+        lon = rnd.uniform(-180, 180)
+
+        packed = ml.encode_user_apps(apps, lat, lon)
+
+        assert packed == reference_user_apps(apps, lat, lon)
+        unpacked = ml.appsinstalled_pb2.UserApps()
+        unpacked.ParseFromString(packed)
+        assert list(unpacked.apps) == apps
+
+
+def test_encode_user_apps_rejects_out_of_range():
+    with pytest.raises(ValueError):
+        ml.encode_user_apps([-1], 0.0, 0.0)
+    with pytest.raises(ValueError):
+        ml.encode_user_apps([2 ** 32], 0.0, 0.0)
+
+
+def test_prototest():
+    ml.prototest()
+
+
+def test_memcache_pool_pipelines_sets():
+    with FakeMemcached() as server:
+        pool = ml.MemcachePool(server.address, size=2, socket_timeout=1.0)
+        items = [(f"idfa:{i}", b"v%d" % i) for i in range(1000)]
+
+        assert pool.set_multi(items) == []
+        assert pool.set_multi([("bad key", b"x"), ("k" * 251, b"x"), ("ok", b"x")]) == ["bad key", "k" * 251]
+        pool.close()
+
+        assert len(server.storage) == 1001
+        assert server.storage[b"idfa:999"] == (0, b"v999")
+        assert pool.reconnects == 1
+
+
+def test_memcache_pool_reconnects_after_server_restart():
+    server = FakeMemcached().start()
+    host, port = server.server_address
+    pool = ml.MemcachePool(server.address, size=1, socket_timeout=1.0, health_interval=0.0, backoff=0.0)
+    assert pool.set_multi([("a", b"1")]) == []
+    server.stop()
+
+    with pytest.raises(OSError):
+        pool.set_multi([("b", b"2")])
+
+    with FakeMemcached(host, port) as restarted:
+        assert pool.set_multi([("c", b"3")]) == []
+        assert b"c" in restarted.storage
+    assert pool.reconnects == 2
+    pool.close()
+
+
+def test_memcache_pool_backs_off_when_down():
+    with FakeMemcached() as server:
+        address = server.address
+    pool = ml.MemcachePool(address, size=1, socket_timeout=0.5, backoff=10.0)
+
+    with pytest.raises(OSError):
+        pool.set_multi([("a", b"1")])
+    with pytest.raises(ConnectionError, match="is down"):
+        pool.set_multi([("a", b"1")])
+
+
+def test_memcache_worker_retries_through_pool(tmp_path):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz",
+                 "".join(f"idfa\tid{i}\t1.0\t2.0\t1\n" for i in range(100)))
+
+    with FakeMemcached() as server:
+        processed, errors = ml.process_file(
+            str(gz), {"idfa": server.address}, dry_run=False, workers=3, batch_size=7,
+            queue_size=10, socket_timeout=1.0, retry=2, retry_backoff=0.0,
+        )
+        assert (processed, errors) == (100, 0)
+        assert len(server.storage) == 100
+
+
+def test_hash_ring_balances_and_remaps_little():
+    nodes = [f"10.0.0.{i}:11211" for i in range(1, 5)]
+    keys = [f"idfa:{random.Random(i).getrandbits(128):032x}" for i in range(20000)]
+    ring = ml.HashRing(nodes)
+
+    placement = {key: ring.get_node(key) for key in keys}
+    counts = collections.Counter(placement.values())
+    assert set(counts) == set(nodes)
+    assert all(abs(count - 5000) < 1000 for count in counts.values())
+
+    grown = ml.HashRing(nodes + ["10.0.0.5:11211"])
+    moved = [key for key in keys if grown.get_node(key) != placement[key]]
+    assert 0.1 < len(moved) / len(keys) < 0.3
+    assert all(grown.get_node(key) == "10.0.0.5:11211" for key in moved)
+
+
+def test_make_rings_accepts_lists_and_comma_separated():
+    rings = ml.make_rings({"idfa": "a:1, b:2", "gaid": ["c:3"], "adid": "", "dvid": None})
+    assert rings["idfa"].nodes == ["a:1", "b:2"]
+    assert rings["gaid"].nodes == ["c:3"]
+    assert "adid" not in rings and "dvid" not in rings
+
+
+def test_process_file_shards_device_type_over_nodes(tmp_path):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz",
+                 "".join(f"idfa\tid{i}\t1.0\t2.0\t1\n" for i in range(400)))
+
+    with FakeMemcached() as first, FakeMemcached() as second:
+        processed, errors = ml.process_file(
+            str(gz), {"idfa": f"{first.address},{second.address}"}, dry_run=False,
+            workers=1, batch_size=16, queue_size=100, socket_timeout=1.0, retry=0, retry_backoff=0.0,
+        )
+        assert (processed, errors) == (400, 0)
+        assert len(first.storage) + len(second.storage) == 400
+        assert first.storage and second.storage
+        assert not set(first.storage) & set(second.storage)
+
+
+def test_latency_histogram_quantiles_and_merge():
+    first, second = ml.LatencyHistogram(), ml.LatencyHistogram()
+    for ms in (0.3, 0.8, 1.5, 4.0):
+        first.observe(ms / 1000)
+    second.observe(7.0)
+    first.merge(second)
+
+    assert first.count == 5
+    assert first.quantile(0.5) == 2.0
+    assert first.quantile(0.99) == pytest.approx(7000.0)
+    assert first.as_dict()["counts"][-1] == 1
+
+
+class FlakyConnections:
+    def __init__(self, failures):
+        self.failures = failures
+
+    def set_multi(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("flaky")
+        return []
+
+
+def test_memcache_worker_counts_retries_and_latency():
+    worker = ml.MemcacheWorker("a:1", None, dry_run=False, batch_size=10, socket_timeout=1.0, retry=2,
+                               retry_backoff=0.0, connections=FlakyConnections(failures=1))
+    worker._flush([(f"k{i}", b"v") for i in range(5)])
+
+    assert (worker.stats.processed, worker.stats.errors) == (5, 0)
+    assert (worker.stats.batches, worker.stats.retries) == (1, 1)
+    assert worker.stats.latency.count == 2
+
+
+def test_process_file_dumps_metrics_json(tmp_path):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz",
+                 "".join(f"idfa\tid{i}\t1.0\t2.0\t1\n" for i in range(200)) + "idfa\tbad\n")
+
+    with FakeMemcached() as server:
+        processed, errors = ml.process_file(
+            str(gz), {"idfa": server.address}, dry_run=False, workers=2, batch_size=16, queue_size=50,
+            socket_timeout=1.0, retry=0, retry_backoff=0.0, metrics_interval=0.01,
+            metrics_dir=str(tmp_path / "metrics"),
+        )
+
+    metrics = json.loads((tmp_path / "metrics" / "20170929000000.tsv.gz.metrics.json").read_text())
+    assert (processed, errors) == (200, 1)
+    assert metrics["lines"] == 201
+    addr = metrics["addrs"][server.address]
+    assert addr["processed"] == 200
+    assert addr["queue_depth"] == 0
+    assert addr["batches"] == addr["set_multi_ms"]["count"] >= 200 // 16
+
+
+def test_batch_sizer_aimd():
+    sizer = ml.BatchSizer(64, max_size=100, latency_budget=0.01)
+    assert sizer.update(0.001) == 72
+    for _ in range(10):
+        sizer.update(0.001)
+    assert sizer.size == 100
+    assert sizer.update(0.05) == 50
+    assert sizer.update(0.001, ok=False) == 25
+
+    fixed = ml.BatchSizer(64)
+    assert fixed.update(1.0) == fixed.update(0.0) == 64
+
+
+class RecordingConnections:
+    def __init__(self):
+        self.batches = []
+
+    def set_multi(self, batch):
+        self.batches.append(list(batch))
+        return []
+
+
+def test_memcache_worker_flushes_partial_batch_by_time():
+    q = queue.Queue()
+    connections = RecordingConnections()
+    worker = ml.MemcacheWorker("a:1", q, dry_run=False, batch_size=100, socket_timeout=1.0, retry=0,
+                               retry_backoff=0.0, connections=connections, flush_interval=0.02)
+    worker.start()
+    for i in range(3):
+        q.put((f"k{i}", b"v"))
+
+    deadline = time.monotonic() + 2.0
+    while not connections.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [len(batch) for batch in connections.batches] == [3]
+
+    q.put(None)
+    worker.join(timeout=2.0)
+    assert not worker.is_alive()
+
+
+def test_feed_queues_keeps_feeding_other_addrs_when_one_is_full():
+    slow, fast = queue.Queue(maxsize=1), queue.Queue()
+    metrics = ml.LoadMetrics("f", {"slow": slow, "fast": fast}, [])
+    fed_fast = []
+
+    def drain():
+        for _ in range(5):
+            time.sleep(0.02)
+            fed_fast.append(fast.qsize())
+            slow.get()
+
+    consumer = threading.Thread(target=drain)
+    consumer.start()
+    ml.feed_queues({"slow": list(range(5)), "fast": list(range(5))}, {"slow": slow, "fast": fast}, metrics)
+    consumer.join()
+
+    assert fed_fast[0] == 5
+    assert metrics.stalls["slow"] > 0
+    assert "fast" not in metrics.stalls
+
+
+@pytest.mark.parametrize("server_cls", [FakeMemcached, AsyncFakeMemcached])
+def test_process_file_asyncio_engine(tmp_path, server_cls):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz",
+                 "".join(f"idfa\tid{i}\t1.0\t2.0\t1,2\n" for i in range(300))
+                 + "".join(f"gaid\tid{i}\t3.0\t4.0\t3\n" for i in range(100)) + "bad line\n")
+
+    with server_cls() as first, server_cls() as second, server_cls() as gaid:
+        processed, errors = ml.process_file(
+            str(gz), {"idfa": [first.address, second.address], "gaid": gaid.address}, dry_run=False,
+            workers=1, batch_size=16, queue_size=20, socket_timeout=1.0, retry=0, retry_backoff=0.0,
+            engine="asyncio", inflight=3, metrics_dir=str(tmp_path),
+        )
+        assert (processed, errors) == (400, 1)
+        assert len(first.storage) + len(second.storage) == 300
+        stored = gaid.storage[b"gaid:id7"]
+        ua = ml.appsinstalled_pb2.UserApps()
+        ua.ParseFromString(stored[1])
+        assert (ua.lat, ua.lon, list(ua.apps)) == (3.0, 4.0, [3])
+
+    metrics = json.loads((tmp_path / "20170929000000.tsv.gz.metrics.json").read_text())
+    assert metrics["lines"] == 401
+    assert len(metrics["addrs"][gaid.address]["batch_size"]) == 3
+
+
+def test_asyncio_engine_counts_errors_when_server_is_down(tmp_path):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz",
+                 "".join(f"idfa\tid{i}\t1.0\t2.0\t1\n" for i in range(50)))
+    server = AsyncFakeMemcached().start()
+    address = server.address
+    server.stop()
+
+    processed, errors = ml.process_file(
+        str(gz), {"idfa": address}, dry_run=False, workers=1, batch_size=100, queue_size=0,
+        socket_timeout=0.5, retry=1, retry_backoff=0.0, engine="asyncio", inflight=1,
+    )
+    assert (processed, errors) == (0, 50)
+
+
+def test_load_checkpoint_advances_only_over_fully_written_chunks(tmp_path):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz", "idfa\tid\t1.0\t2.0\t1\n")
+    checkpoint = ml.LoadCheckpoint(str(gz))
+
+    first = checkpoint.register(0, {"a": [("k1", b"v"), ("k2", b"v")]}, 10, 100)
+    second = checkpoint.register(1, {"a": [("k3", b"v")], "b": [("k4", b"v")]}, 20, 200)
+    third = checkpoint.register(2, {"b": [("k5", b"v")]}, 30, 300)
+    checkpoint.register(3, {}, 40, 400)
+
+    checkpoint.ack(second["a"] + second["b"])
+    assert checkpoint.line == 0
+    checkpoint.ack(first["a"])
+    assert (checkpoint.line, checkpoint.offset) == (20, 200)
+    checkpoint.ack(third["b"], failed_keys=["k5"])
+    assert checkpoint.line == 20
+
+    checkpoint.save()
+    assert ml.LoadCheckpoint(str(gz)).line == 20
+    make_gz(tmp_path, "20170929000000.tsv.gz", "idfa\tid\t1.0\t2.0\t1\nidfa\tid2\t1.0\t2.0\t1\n")
+    assert ml.LoadCheckpoint(str(gz)).line == 0
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_process_file_resumes_from_checkpoint_after_crash(tmp_path, monkeypatch, engine):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz",
+                 "".join(f"idfa\tid{i}\t1.0\t2.0\t1\n" for i in range(500)))
+    options = dict(dry_run=False, workers=2, batch_size=8, queue_size=0, socket_timeout=1.0, retry=0,
+                   retry_backoff=0.0, chunk_lines=100, flush_interval=0.01, engine=engine, inflight=2,
+                   checkpoint_interval=0.001)
+    original = ml.iter_parsed_chunks
+
+    def crash_after_two_chunks(*args, **kwargs):
+        for i, parsed in enumerate(original(*args, **kwargs)):
+            if i == 2:
+                time.sleep(0.3)
+                raise RuntimeError("killed")
+            yield parsed
+
+    with FakeMemcached() as server:
+        monkeypatch.setattr(ml, "iter_parsed_chunks", crash_after_two_chunks)
+        with pytest.raises(RuntimeError):
+            ml.process_file(str(gz), {"idfa": server.address}, **options)
+        state = json.loads((tmp_path / "20170929000000.tsv.gz.checkpoint").read_text())
+        assert state["line"] == 200
+        assert state["offset"] > 0
+        assert len(server.storage) == 200
+
+        monkeypatch.setattr(ml, "iter_parsed_chunks", original)
+        server.storage.clear()
+        processed, errors = ml.process_file(str(gz), {"idfa": server.address}, **options)
+        assert (processed, errors) == (300, 0)
+        assert sorted(server.storage) == sorted(b"idfa:id%d" % i for i in range(200, 500))
+    assert not (tmp_path / "20170929000000.tsv.gz.checkpoint").exists()
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_process_file_saves_checkpoint_while_draining(tmp_path, monkeypatch, engine):
+    gz = make_gz(tmp_path, "20170929000000.tsv.gz",
+                 "".join(f"idfa\tid{i}\t1.0\t2.0\t1\n" for i in range(200)))
+    options = dict(dry_run=False, workers=1, batch_size=8, queue_size=0, socket_timeout=1.0, retry=0,
+                   retry_backoff=0.0, chunk_lines=50, flush_interval=0.01, engine=engine, inflight=1,
+                   checkpoint_interval=0.001)
+    original = ml.iter_parsed_chunks
+    parsed = threading.Event()
+
+    def parse_then_flag(*args, **kwargs):
+        yield from original(*args, **kwargs)
+        parsed.set()
+
+    def interrupt_while_draining(self):
+        if parsed.is_set():
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(ml, "iter_parsed_chunks", parse_then_flag)
+    monkeypatch.setattr(ml, "DRAIN_POLL", 0.001)
+    monkeypatch.setattr(ml.LoadCheckpoint, "maybe_save", interrupt_while_draining)
+    with (AsyncFakeMemcached if engine == "asyncio" else FakeMemcached)(latency=0.01) as server:
+        with pytest.raises(KeyboardInterrupt):
+            ml.process_file(str(gz), {"idfa": server.address}, **options)
+    assert (tmp_path / "20170929000000.tsv.gz.checkpoint").exists()